@@ -0,0 +1,133 @@
+"""
+Vectorized autoregressive rollout of the hourly correlated Gaussian process models over several hours (e.g. 24 hour
+forecasts for every day of the test set)
+"""
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+
+def daily_start_positions(index, hour=0, n_steps=24):
+    """
+    Positions of the rows of an hourly index at the given hour that are followed by n_steps - 1 consecutive
+    hours, i.e., the start times of complete rollouts (one per day for the default arguments).
+
+    Args:
+        index (pandas.DatetimeIndex): Hourly index of the inputs (gaps are allowed).
+        hour (int, optional): Hour of day of the start times.
+        n_steps (int, optional): Number of hours of the rollouts.
+
+    Returns:
+        numpy.ndarray: positions of the start times
+    """
+
+    index = pd.DatetimeIndex(index)
+    positions = np.flatnonzero(index.hour == hour)
+    positions = positions[positions + n_steps - 1 < len(index)]
+    complete = index[positions + n_steps - 1] - index[positions] == pd.Timedelta(hours=n_steps - 1)
+
+    return positions[complete]
+
+
+def rollout(model, inputs, start_positions, kernel, n_steps=24, normalizer=None, column=-1, n_samples=0, seed=None,
+            compiled=False, batch_size=4096):
+    """
+    Autoregressive rollout of a correlated Gaussian process model (outputs: N means and the logit of the kernel
+    scale) for many start times at once. The model is evaluated for the hours p, ..., p + n_steps - 1 of each start
+    position p, and from the second hour on the initial frequency column of the inputs is replaced by the final
+    value of the previous hour. All trajectories are evaluated per hour in batches of batch_size.
+
+    Without samples, the final mean of the previous hour is fed back (deterministic rollout). With n_samples > 0,
+    n_samples trajectories N(mu, scale * K) are sampled per start time and hour, and the final sampled value is
+    fed back, so that the trajectories propagate the uncertainty of the previous hours.
+
+    Args:
+        model: Keras model of the hourly forecasts.
+        inputs (numpy.ndarray): Normalized inputs of all hours (n_hours, n_features).
+        start_positions (numpy.ndarray): Rows of the start times (see daily_start_positions).
+        kernel (numpy.ndarray): Kernel matrix K of the model (N, N).
+        n_steps (int, optional): Number of hours.
+        normalizer (StreamingNormalizer, optional): Normalizer of the inputs to transform the fed back frequency
+        (in Hz). The frequency is fed back without transformation by default.
+        column (int, optional): Column of the initial frequency value in the inputs.
+        n_samples (int, optional): Number of sampled trajectories per start time (0 for the deterministic rollout).
+        seed (int, optional): Seed of the sampled trajectories.
+        compiled (bool, optional): Run the loop as compiled tf.function (calls the model directly) instead of
+        model.predict per hour. The compiled loop is run for batches of batch_size trajectories.
+        batch_size (int, optional): Batch size of the model calls.
+
+    Returns:
+        tuple: means (n_starts, [n_samples,] n_steps, N) and scales (n_starts, [n_samples,] n_steps) of the
+        angular frequency per hour, and the sampled trajectories (n_starts, n_samples, n_steps * N) or None
+    """
+
+    start_positions = np.asarray(start_positions)
+    if start_positions.max(initial=0) + n_steps > len(inputs):
+        raise ValueError('The rollouts exceed the inputs!')
+    n_features = inputs.shape[1]
+    column = column % n_features
+    cholesky = np.linalg.cholesky(np.asarray(kernel, dtype='float64')).astype('float32')
+    N = len(cholesky)
+
+    # Inputs of all trajectories and hours (n_trajectories, n_steps, n_features)
+    features = np.asarray(inputs, dtype='float32')[start_positions[:, None] + np.arange(n_steps)]
+    if n_samples:
+        features = np.repeat(features, n_samples, axis=0)
+    n_trajectories = len(features)
+
+    # The noise is drawn in advance, so that both modes give the same trajectories for a seed
+    noise = None
+    if n_samples:
+        rng = np.random.default_rng(seed)
+        noise = rng.standard_normal((n_steps, n_trajectories, N), dtype='float32')
+
+    if normalizer is None:
+        shift, factor = 0., 1.
+    else:
+        shift, factor = normalizer.mean[column], normalizer.scale[column]
+
+    def loop(features, noise, predict):
+        means, scales, paths = [], [], []
+        last = None
+        for step in range(n_steps):
+            x = features[:, step]
+            if step > 0:
+                # Final value of the previous hour (angular frequency) as normalized frequency in Hz
+                fed_back = tf.cast((last/(2*np.pi) + 50.0 - shift)/factor, x.dtype)
+                x = tf.concat([x[:, :column], fed_back[:, None], x[:, column + 1:]], axis=1)
+            outputs = tf.convert_to_tensor(predict(x))
+            mu = 2*np.pi*outputs[:, :N]
+            scale = (2*np.pi)**2*tf.math.sigmoid(outputs[:, N])
+            means.append(mu)
+            scales.append(scale)
+            if noise is None:
+                last = mu[:, -1]
+            else:
+                path = mu + tf.sqrt(scale)[:, None]*tf.matmul(noise[step], cholesky, transpose_b=True)
+                paths.append(path)
+                last = path[:, -1]
+
+        return tf.stack(means, 1), tf.stack(scales, 1), tf.stack(paths, 1) if paths else None
+
+    if compiled:
+        # The trajectories are independent, so that the loop is run batch by batch (retraced at most once for the
+        # last batch), and the model is not called for all trajectories at once
+        compiled_loop = tf.function(lambda f, z: loop(f, z, lambda x: model(x, training=False)),
+                                    reduce_retracing=True)
+        batches = [compiled_loop(tf.constant(features[i:i + batch_size]),
+                                 None if noise is None else tf.constant(noise[:, i:i + batch_size]))
+                   for i in range(0, max(n_trajectories, 1), batch_size)]
+        means, scales, paths = [None if batches[0][k] is None else np.concatenate([np.asarray(b[k]) for b in batches])
+                                for k in range(3)]
+    else:
+        means, scales, paths = loop(features, noise, lambda x: model.predict(np.asarray(x), batch_size=batch_size,
+                                                                               verbose=0))
+
+    shape = (len(start_positions), n_samples) if n_samples else (len(start_positions),)
+    means = np.asarray(means).reshape(shape + (n_steps, N))
+    scales = np.asarray(scales).reshape(shape + (n_steps,))
+    if paths is not None:
+        paths = np.asarray(paths).reshape(shape + (n_steps*N,))
+
+    return means, scales, paths
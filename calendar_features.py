@@ -0,0 +1,204 @@
+"""
+Vectorized calendar features (EFA blocks, settlement periods, local time and cyclic encodings) on regular time grids
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+SECOND = 10**9
+MINUTE = 60 * SECOND
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Features that can be computed by calendar_features
+CALENDAR_COLUMNS = ['efa_block', 'efa_day', 'settlement_period', 'local_hour', 'local_minute',
+                    'hour_sin', 'hour_cos', 'minute_sin', 'minute_cos']
+
+# Hourly UTC offsets of the last CACHE_SIZE ranges of hours (tz, first hour, number of hours). The tables are
+# small (8 bytes per hour), so that the cache does not grow with the resolution of the grids.
+CACHE_SIZE = 8
+_cache = OrderedDict()
+
+
+def calendar_features(start, length, step=1, tz='Europe/London', columns=None):
+    """
+    Calendar features of the regular time grid start + i * step (i < length) in local time of tz. The features
+    are computed for the whole grid at once with integer arithmetic on the local timestamps. The local time is
+    looked up in a cached table of the hourly UTC offsets of tz (see hourly_offsets), so that the time zone
+    conversion is not repeated for every grid point.
+
+    Features:
+        efa_block: EFA block 1-6 of the (local) 4h intervals starting at 23:00, 3:00, ..., 19:00.
+        efa_block_elapsed: EFA block 1-6 by the elapsed time since the start of the EFA day (23:00 local time),
+        as assigned by the former timestamp_to_efa_block. It differs from efa_block only on DST change days, where
+        the blocks after the change are shifted by one hour (and the 25th hour is block 1). Not in the default
+        columns.
+        efa_day: EFA day, i.e., the day that starts at 23:00 local time of the previous day.
+        settlement_period: Half-hourly settlement period since local midnight (1-46/48/50 on DST changes).
+        local_hour, local_minute: DST-aware local wall clock time.
+        hour_sin, hour_cos, minute_sin, minute_cos: Cyclic encodings of the local time (hour with minute
+        fraction and minute of the hour).
+
+    Args:
+        start (pandas.Timestamp): First timestamp of the grid. Naive timestamps are localized in tz.
+        length (int): Number of grid points.
+        step (int, optional): Time step of the grid in seconds.
+        tz (str, optional): Time zone of the local time.
+        columns (list, optional): Features to compute (default: CALENDAR_COLUMNS).
+
+    Returns:
+        pandas.DataFrame: features with tz-aware grid index.
+    """
+
+    columns = CALENDAR_COLUMNS if columns is None else list(columns)
+    start = pd.Timestamp(start)
+    start = start.tz_localize(tz) if start.tz is None else start.tz_convert(tz)
+
+    utc_ns = start.value + step * SECOND * np.arange(length, dtype=np.int64)
+    features = compute_calendar_features(utc_ns, tz, columns, grid_local_ns(utc_ns, tz))
+    index = pd.date_range(start=start, periods=length, freq='{}s'.format(step))
+
+    return pd.DataFrame(features, index=index)[columns]
+
+
+def index_calendar_features(index, tz=None, columns=None):
+    """
+    Calendar features (see calendar_features) of the timestamps in index. Naive indices are localized in tz,
+    or interpreted as local time without DST changes for tz=None. Regular indices are computed as grids (see
+    calendar_features).
+
+    Args:
+        index (pandas.DatetimeIndex): Time index.
+        tz (str, optional): Time zone of a naive index.
+        columns (list, optional): Features to compute (default: CALENDAR_COLUMNS).
+
+    Returns:
+        pandas.DataFrame: features with the original index.
+    """
+
+    if index.tz is None:
+        aware = index.tz_localize('UTC' if tz is None else tz, ambiguous='infer')
+    else:
+        aware = index
+    utc_ns = aware.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ns]').view(np.int64)
+
+    steps = np.diff(utc_ns)
+    if len(index) > 1 and (steps == steps[0]).all() and steps[0] % SECOND == 0 and steps[0] > 0:
+        features = calendar_features(aware[0], len(index), steps[0] // SECOND, str(aware.tz), columns)
+        features.index = index
+        return features
+
+    columns = CALENDAR_COLUMNS if columns is None else list(columns)
+
+    return pd.DataFrame(compute_calendar_features(utc_ns, str(aware.tz), columns), index=index)[columns]
+
+
+def compute_calendar_features(utc_ns, tz, columns, local_ns=None):
+    """ Compute the calendar features columns of timestamps in ns since epoch (UTC) and optionally of their
+    local time in ns. Return dict of arrays."""
+
+    local_ns = as_local_ns(utc_ns, tz) if local_ns is None else local_ns
+    time_of_day = local_ns % DAY
+    hour = (time_of_day // HOUR).astype(np.int8)
+    minute = (time_of_day // MINUTE % 60).astype(np.int8)
+    features = {}
+
+    for column in columns:
+        if column == 'efa_block':
+            features[column] = ((hour + 1) % 24 // 4 + 1).astype(np.int8)
+        elif column == 'efa_block_elapsed':
+            elapsed = elapsed_since_day_start(utc_ns, local_ns, tz, -HOUR)
+            features[column] = (elapsed // (4 * HOUR) % 6 + 1).astype(np.int8)
+        elif column == 'efa_day':
+            features[column] = ((local_ns + HOUR) // DAY).astype('datetime64[D]')
+        elif column == 'settlement_period':
+            features[column] = settlement_periods(utc_ns, local_ns, tz)
+        elif column == 'local_hour':
+            features[column] = hour
+        elif column == 'local_minute':
+            features[column] = minute
+        elif column in ('hour_sin', 'hour_cos', 'minute_sin', 'minute_cos'):
+            # The encodings only depend on the minute of the day, so that they are looked up in a table
+            table_hour, table_minute = np.divmod(np.arange(1440), 60)
+            if column.startswith('hour'):
+                angle = (table_hour + table_minute / 60) / 24 * 2 * np.pi
+            else:
+                angle = table_minute / 60 * 2 * np.pi
+            table = np.sin(angle) if column.endswith('sin') else np.cos(angle)
+            features[column] = table[hour.astype(np.int64) * 60 + minute]
+        else:
+            raise ValueError('Unknown calendar feature {}!'.format(column))
+
+    return features
+
+
+def as_local_ns(utc_ns, tz):
+    """ Local wall clock time in ns of timestamps in ns since epoch (UTC)."""
+
+    if str(tz) == 'UTC':
+        return utc_ns
+    local = pd.DatetimeIndex(utc_ns.view('datetime64[ns]')).tz_localize('UTC').tz_convert(tz).tz_localize(None)
+
+    return local.values.astype('datetime64[ns]').view(np.int64)
+
+
+def hourly_offsets(first_hour, n_hours, tz):
+    """ UTC offsets in ns of tz at the full hours first_hour, ..., first_hour + n_hours (in hours since epoch).
+    The tables of the last CACHE_SIZE ranges are cached."""
+
+    key = (str(tz), int(first_hour), int(n_hours))
+    offsets = _cache.pop(key, None)
+    if offsets is None:
+        hours = (first_hour + np.arange(n_hours + 1, dtype=np.int64)) * HOUR
+        offsets = as_local_ns(hours, tz) - hours
+    _cache[key] = offsets
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+    return offsets
+
+
+def grid_local_ns(utc_ns, tz):
+    """ Local wall clock time in ns of sorted timestamps in ns since epoch (UTC). The offsets are looked up per
+    hour (see hourly_offsets) and only the hours with a change of the offset are converted point by point."""
+
+    if str(tz) == 'UTC' or not utc_ns.size:
+        return utc_ns
+    hour = utc_ns // HOUR
+    first_hour = hour[0]
+    offsets = hourly_offsets(first_hour, hour[-1] - first_hour + 1, tz)
+    local_ns = utc_ns + offsets[hour - first_hour]
+
+    for changing in np.flatnonzero(offsets[1:] != offsets[:-1]) + first_hour:
+        lower, upper = np.searchsorted(hour, [changing, changing + 1])
+        local_ns[lower:upper] = as_local_ns(utc_ns[lower:upper], tz)
+
+    return local_ns
+
+
+def settlement_periods(utc_ns, local_ns, tz):
+    """ Half-hourly settlement periods since local midnight. The periods count the elapsed time, so that days
+    with DST changes have 46 or 50 periods."""
+
+    return (elapsed_since_day_start(utc_ns, local_ns, tz) // (30 * MINUTE) + 1).astype(np.int8)
+
+
+def elapsed_since_day_start(utc_ns, local_ns, tz, day_start=0):
+    """ Elapsed time in ns since the start of the local day, which begins day_start ns after local midnight
+    (e.g. -HOUR for the EFA days that start at 23:00 of the previous day)."""
+
+    # Start of each local day in UTC (only computed for the distinct days)
+    days = (local_ns - day_start) // DAY
+    first_day = days.min() if days.size else 0
+    day_range = (first_day + np.arange(days.max() - first_day + 1 if days.size else 0)) * DAY + day_start
+    day_starts = pd.DatetimeIndex(day_range.view('datetime64[ns]')).tz_localize(tz, ambiguous=True,
+                                                                                nonexistent='shift_forward')
+    day_starts_ns = day_starts.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ns]').view(np.int64)
+
+    return utc_ns - day_starts_ns[days - first_day]
+
+
+def clear_calendar_cache():
+    _cache.clear()
@@ -1,12 +1,10 @@
-import glob
 import numpy as np
 import pandas as pd
 import sys
 
 sys.path.append('./')
 
-from scripts.helper_functions import const_windows, nan_windows, create_year_folders
-from scripts.helper_functions import isolated_peaks,  extreme_points
+from scripts.helper_functions import clean_chunks, iter_chunks, open_writer
 
 # Add path to processed data!
 path_to_data = './'
@@ -16,6 +14,13 @@ tso_names = ['TransnetBW', 'Nationalgrid', 'Fingrid']
 suffix = '_cleansed'
 precisions = ['%.6f','%.3f','%.4f']
 
+# Storage format of the converted and cleansed data: 'zip' (csv), 'npy', 'parquet' or e.g. 'zip,npy' for several
+storage = 'zip'
+# Precision of the values in the binary formats
+dtype = 'float64'
+# Number of values per chunk of the out-of-core cleansing (bounds the memory)
+chunk_size = 2**22
+
 # Set parameters for identifying corrupted data 
 
 # Nan-points to fill 
@@ -32,66 +37,27 @@ df_c=0.05
 for precision, tso_name in zip(precisions, tso_names):
     
     print('Marking and cleansing data from {}'.format(tso_name))
-    
-    ### Read the frequency data and calculate the increments ###
-    
-    print('Load data ...')
-    files = glob.glob(path_to_data + '*_converted/' + '{}/'.format(tso_name) + '*.zip')
-    files = np.sort(files)
-    data = pd.Series(dtype=float)
-    for i,file in enumerate(files):
-        print('{} ({} of {})'.format(file, i+1, len(files)))
-        chunk = pd.read_csv(file, index_col=0, header=None, squeeze=True)
-        data = data.append(chunk)
-    data.index = pd.to_datetime(data.index)
-    
-    df = data.diff()  
 
-    ### Find positions and numbers of corrupted data ###
-    
-    print('Find corrupted data ...')
-    # Indices where f(t) is too high/low
-    f_too_low, f_too_high = extreme_points(data, (49, 51))
-    # Location of isolated peaks
-    peak_loc=isolated_peaks(df, df_c)
-    # Right/Left bounds, sizes and indices of windows (>1 point) and long windows (> T_c points) 
-    window_bounds, window_sizes, long_windows_indices, long_window_bounds=const_windows(df, T_c)
-    # Right/Left indices and sizes of missing data 
-    missing_data_bounds, missing_data_sizes = nan_windows(data)
- 
-    ### Mark corrupted data as NaN ###
-    
-    print('Mark corrupted data ...')
-    data_m=data.copy()
-    # Mark extreme values >51Hz and <49Hz 
-    data_m.iloc[f_too_low]=np.nan
-    data_m.iloc[f_too_high]=np.nan
-    # Mark isolated peaks with abs. increments > df_c 
-    data_m.iloc[peak_loc]=np.nan
-    # Mark windows with const. freq. longer than T_c
-    data_m.iloc[long_windows_indices]=np.nan
-
-    ### Cleansing data by filling intervals of missing/ corrupted data ###
-    
-    # You can add your own cleansing procedure!
-    # Here, we fill up to N_f values by propagating the last valid entry
-    print('Clean corrupted data ...')
-    data_cl=data_m.fillna(method='ffill', limit=N_f)
-    
+    ### Mark and clean corrupted data chunk by chunk ###
+
+    # The converted data is streamed in chunks through marking and cleansing, and each cleansed chunk is written
+    # at once, so that the memory is bounded by the chunk size. The results are identical to marking extreme 
+    # values >51Hz and <49Hz, isolated peaks with abs. increments > df_c and windows with const. freq. longer 
+    # than T_c on the complete series (see find_corrupted_data) and filling up to N_f values by propagating 
+    # the last valid entry. Samples whose marking depends on the next chunk are carried over by clean_chunks.
+    print('Mark and clean corrupted data in chunks ...')
+    chunks = iter_chunks(path_to_data, '_converted', tso_name, storage=storage.split(',')[0], chunk_size=chunk_size)
+
     ### Save cleansed data (including the remaining NaN-values) ###
-    
-    print('Saving the results ...')
-    create_year_folders(path_to_data, data_cl, suffix, tso_name)
-    data_cl.groupby(by=data_cl.index.year).apply(lambda x: x.to_csv(path_to_data + '{}'.format(x.name) + suffix + \
-                                                                    '/' + tso_name + '/{}.zip'.format(x.name),
-                                                                    float_format=precision,
-                                                                    na_rep='NaN',
-                                                                    compression={'method':'zip',
-                                                                                 'archive_name':'{}.csv'.format(x.name)},
-                                                                    header=False))
+
+    with open_writer(path_to_data, suffix, tso_name, storage, float_format=precision, dtype=dtype) as writer:
+        for chunk in clean_chunks(chunks, N_f, T_c, df_c, (49, 51)):
+            writer.write(chunk)
 
     ### Optional: Select longest interval with non-NaN data ### 
     
+    # # Load the cleansed data (requires read_years and true_intervals from scripts.helper_functions)
+    # data_cl = read_years(path_to_data, suffix, tso_name, storage=storage.split(',')[0])
     # # Find non-NaN intervals and print maximum length 
     # valid_bounds, valid_sizes = true_intervals(~data_cl.isnull())
     # print('Length of longest interval without NaNs [in months]: ca. {:.0f}'.format(np.max(valid_sizes) / (3600.*24*30) ) )
@@ -0,0 +1,146 @@
+"""
+Closed-form proper scores (CRPS, log score, quantile and interval scores) of Gaussian, Student-t and Cauchy
+forecasts over (hours x horizon) arrays
+"""
+
+import numpy as np
+from scipy import special
+
+FAMILIES = ('normal', 'student', 'cauchy')
+
+
+def standardized_cdf(z, family, df=None):
+    if family == 'normal':
+        return special.ndtr(z)
+    if family == 'student':
+        return special.stdtr(df, z)
+    if family == 'cauchy':
+        return 0.5 + np.arctan(z)/np.pi
+    raise ValueError('Unknown family {}!'.format(family))
+
+
+def standardized_pdf(z, family, df=None):
+    if family == 'normal':
+        return np.exp(-0.5*z**2)/np.sqrt(2*np.pi)
+    if family == 'student':
+        return np.exp(-standardized_log_score(z, family, df))
+    if family == 'cauchy':
+        return 1/(np.pi*(1 + z**2))
+    raise ValueError('Unknown family {}!'.format(family))
+
+
+def standardized_quantile(level, family, df=None):
+    if family == 'normal':
+        return special.ndtri(level)
+    if family == 'student':
+        return special.stdtrit(df, level)
+    if family == 'cauchy':
+        return np.tan(np.pi*(level - 0.5))
+    raise ValueError('Unknown family {}!'.format(family))
+
+
+def standardized_log_score(z, family, df=None):
+    """ Negative log density of the standardized distribution."""
+
+    if family == 'normal':
+        return 0.5*np.log(2*np.pi) + 0.5*z**2
+    if family == 'student':
+        return (special.gammaln(df/2) - special.gammaln((df + 1)/2) + 0.5*np.log(df*np.pi)
+                + (df + 1)/2*np.log1p(z**2/df))
+    if family == 'cauchy':
+        return np.log(np.pi) + np.log1p(z**2)
+    raise ValueError('Unknown family {}!'.format(family))
+
+
+def standardized_crps(z, family, df=None):
+    """ CRPS of the standardized distribution (Gneiting and Raftery 2007, Jordan et al. 2019). The CRPS of the
+    Student-t distribution is infinite for df <= 1 and hence for the Cauchy distribution."""
+
+    if family == 'normal':
+        return z*(2*special.ndtr(z) - 1) + 2*standardized_pdf(z, family) - 1/np.sqrt(np.pi)
+    if family == 'student':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            expected = 2*np.sqrt(df)*np.exp(special.betaln(0.5, df - 0.5) - 2*special.betaln(0.5, df/2))/(df - 1)
+            crps = (z*(2*special.stdtr(df, z) - 1) + 2*standardized_pdf(z, family, df)*(df + z**2)/(df - 1)
+                    - expected)
+        return np.where(df > 1, crps, np.inf)
+    if family == 'cauchy':
+        return np.full(np.shape(z), np.inf)
+    raise ValueError('Unknown family {}!'.format(family))
+
+
+def quantile(level, loc, scale, family='normal', df=None):
+    """ Quantile of the forecasts at level (in (0, 1))."""
+    return loc + scale*standardized_quantile(level, family, df)
+
+
+def _score(kernel, y, loc, scale, df, dtype, chunk_size, out):
+    """ Evaluate kernel(y, loc, scale, df) in chunks of rows and write the results to out (new array of dtype by
+    default)."""
+
+    y = np.asarray(y)
+    loc, scale = np.broadcast_to(loc, y.shape), np.broadcast_to(scale, y.shape)
+    df = None if df is None else np.broadcast_to(df, y.shape)
+    if out is None:
+        out = np.empty(y.shape, dtype=dtype)
+
+    for i in range(0, max(len(y), 1), chunk_size):
+        rows = slice(i, i + chunk_size)
+        out[rows] = kernel(np.asarray(y[rows], dtype=dtype), np.asarray(loc[rows], dtype=dtype),
+                           np.asarray(scale[rows], dtype=dtype), None if df is None else df[rows])
+
+    return out
+
+
+def crps(y, loc, scale, family='normal', df=None, dtype='float64', chunk_size=4096, out=None):
+    """
+    Closed-form CRPS of the forecasts loc + scale * X with X of family ('normal', 'student' with df degrees of
+    freedom or 'cauchy') for the observations y. All arrays are broadcast to the shape of y, e.g. (hours,
+    horizon), and the scores are computed in chunks of chunk_size rows with the given dtype.
+
+    Args:
+        y (numpy.ndarray): Observations.
+        loc (numpy.ndarray): Locations (means of the Gaussian, medians of the Cauchy forecasts).
+        scale (numpy.ndarray): Scales (std of the Gaussian forecasts).
+        family (str, optional): 'normal', 'student' or 'cauchy'.
+        df (numpy.ndarray, optional): Degrees of freedom of the Student-t forecasts.
+        dtype (str, optional): 'float64' or 'float32'.
+        chunk_size (int, optional): Number of rows per chunk.
+        out (numpy.ndarray, optional): Array for the scores (e.g. to reuse memory).
+
+    Returns:
+        numpy.ndarray: CRPS of each forecast
+    """
+
+    return _score(lambda y, loc, scale, df: scale*standardized_crps((y - loc)/scale, family, df),
+                  y, loc, scale, df, dtype, chunk_size, out)
+
+
+def log_score(y, loc, scale, family='normal', df=None, dtype='float64', chunk_size=4096, out=None):
+    """ Log score (negative log-likelihood) of each forecast (arguments as for crps)."""
+
+    return _score(lambda y, loc, scale, df: standardized_log_score((y - loc)/scale, family, df) + np.log(scale),
+                  y, loc, scale, df, dtype, chunk_size, out)
+
+
+def quantile_score(y, loc, scale, level, family='normal', df=None, dtype='float64', chunk_size=4096, out=None):
+    """ Quantile (pinball) score of the quantile at level of each forecast (arguments as for crps)."""
+
+    def kernel(y, loc, scale, df):
+        q = quantile(level, loc, scale, family, df)
+        return ((y < q) - level)*(q - y)
+
+    return _score(kernel, y, loc, scale, df, dtype, chunk_size, out)
+
+
+def interval_score(y, loc, scale, alpha=0.1, family='normal', df=None, dtype='float64', chunk_size=4096,
+                   out=None):
+    """ Interval score of the central (1 - alpha) prediction interval of each forecast (arguments as for
+    crps), i.e., the width of the interval plus 2/alpha times the distance of observations outside of it."""
+
+    def kernel(y, loc, scale, df):
+        lower = quantile(alpha/2, loc, scale, family, df)
+        upper = quantile(1 - alpha/2, loc, scale, family, df)
+        return (upper - lower) + 2/alpha*(np.maximum(lower - y, 0) + np.maximum(y - upper, 0))
+
+    return _score(kernel, y, loc, scale, df, dtype, chunk_size, out)
@@ -0,0 +1,88 @@
+"""
+Batched conditioning of Gaussian forecasts with a shared kernel matrix on observed prefixes
+"""
+
+import numpy as np
+from scipy.linalg import solve_triangular
+
+
+class SharedKernelConditioner:
+    """
+    Conditional statistics of Gaussian forecasts N(mu_i, s_i * K) of many samples i with a shared kernel
+    matrix K that is only scaled per sample (as the outputs of the correlated Gaussian process models). The
+    Cholesky factor L of K is computed once. With the whitened residuals z_i = L^-1 (y_i - mu_i) / sqrt(s_i),
+    which are computed for all samples with one triangular solve, the conditional distributions on observed
+    prefixes follow without refactorizing the covariance matrices:
+
+        mean of y_k given y_<k:  mu_k + sqrt(s) * sum_{j<k} L_kj z_j,  std: sqrt(s) * L_kk
+        mean of y_>=p given y_<p:  mu_>=p + sqrt(s) * L[p:, :p] z_<p,  std: sqrt(s * sum_{j>=p} L_kj^2)
+
+    Args:
+        kernel (numpy.ndarray): Shared (positive definite) kernel matrix K of shape (n, n).
+        jitter (float, optional): Value added to the diagonal of K for the Cholesky decomposition.
+    """
+
+    def __init__(self, kernel, jitter=0.):
+        kernel = np.asarray(kernel, dtype='float64')
+        self.kernel = kernel
+        self.cholesky = np.linalg.cholesky(kernel + jitter*np.eye(len(kernel)))
+        self.diagonal = np.diag(self.cholesky).copy()
+
+    def whiten(self, residuals):
+        """ Whitened residuals L^-1 r of the rows r of residuals (one solve for all rows)."""
+        return solve_triangular(self.cholesky, np.asarray(residuals, dtype='float64').T, lower=True).T
+
+    def sequential(self, mu, y, scale=1.):
+        """
+        One-step conditional statistics, i.e., mean and std of each time step given the observed values of all
+        previous time steps of the sample (conditional nowcast along the whole horizon).
+
+        Args:
+            mu (numpy.ndarray): Means of shape (n_samples, n).
+            y (numpy.ndarray): Observed values of shape (n_samples, n).
+            scale (numpy.ndarray or float, optional): Scale s_i of the kernel of each sample (n_samples,).
+
+        Returns:
+            tuple: conditional means and stds of shape (n_samples, n)
+        """
+
+        scale = np.reshape(scale, (-1, 1))
+        y = np.asarray(y, dtype='float64')
+
+        # y_k - mu_k = sqrt(s) sum_{j<=k} L_kj z_j, hence the conditional mean is y_k - sqrt(s) L_kk z_k
+        z = self.whiten(y - mu)
+        mean = y - self.diagonal*z
+        std = np.sqrt(scale)*self.diagonal*np.ones_like(mean)
+
+        return mean, std
+
+    def prefix(self, mu, y, n_observed, scale=1.):
+        """
+        Conditional statistics of the time steps n_observed, ..., n-1 given the first n_observed values of the
+        samples. The observed time steps are returned with their values and zero std.
+
+        Args:
+            mu (numpy.ndarray): Means of shape (n_samples, n).
+            y (numpy.ndarray): Observed values of shape (n_samples, >= n_observed).
+            n_observed (int): Length of the observed prefix.
+            scale (numpy.ndarray or float, optional): Scale s_i of the kernel of each sample (n_samples,).
+
+        Returns:
+            tuple: conditional means and stds of shape (n_samples, n)
+        """
+
+        scale = np.reshape(scale, (-1, 1))
+        mu = np.asarray(mu, dtype='float64')
+        observed = np.asarray(y, dtype='float64')[:, :n_observed]
+
+        # The whitened residuals of the prefix only depend on the leading block of the Cholesky factor
+        z = solve_triangular(self.cholesky[:n_observed, :n_observed], (observed - mu[:, :n_observed]).T,
+                             lower=True).T
+        mean = mu.copy()
+        mean[:, :n_observed] = observed
+        mean[:, n_observed:] += z @ self.cholesky[n_observed:, :n_observed].T
+
+        std = np.zeros(mu.shape[1])
+        std[n_observed:] = np.sqrt((self.cholesky[n_observed:, n_observed:]**2).sum(1))
+
+        return mean, np.sqrt(scale)*std
@@ -1,4 +1,5 @@
 # %%
+import argparse
 import sys
 sys.path.append('./')
 
@@ -9,27 +10,41 @@ path_to_data = './'
 # Add path to external (downloaded) data
 path_to_external_data = '../../External_data/'
 
+# Number of processes used to convert the monthly files (e.g. --workers 8) and storage format of the outputs
+# ('zip', 'npy', 'parquet' or e.g. 'zip,npy' for several formats, see open_writer)
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', type=int, default=1)
+parser.add_argument('--storage', default='zip')
+parser.add_argument('--dtype', default='float64')
+args = parser.parse_known_args()[0]
+workers, storage, dtype = args.workers, args.storage, args.dtype
+
 
 # %% TransnetBW
 
-in_path = path_to_external_data + 'Germany/transnetbw_frequency_data/'
-tso_name = 'TransnetBW'
+# The __main__ guards are required for the process pool on platforms that spawn new processes
+if __name__ == '__main__':
+    in_path = path_to_external_data + 'Germany/transnetbw_frequency_data/'
+    tso_name = 'TransnetBW'
 
-correct_indices_transnet(in_path, path_to_data, tso_name)
+    correct_indices_transnet(in_path, path_to_data, tso_name, workers=workers, storage=storage, dtype=dtype)
 
 # %% Fingrid
 
-in_path = path_to_external_data + 'Finland/fingrid_historic_frequency_data/'
-tso_name = 'Fingrid'
+if __name__ == '__main__':
+    in_path = path_to_external_data + 'Finland/fingrid_historic_frequency_data/'
+    tso_name = 'Fingrid'
 
-correct_indices_fingrid(in_path, path_to_data, tso_name)
+    correct_indices_fingrid(in_path, path_to_data, tso_name, workers=workers, storage=storage, dtype=dtype)
 
 #%% Nationalgrid
 
-in_path = path_to_external_data + 'GreatBritain/nationalgrideso_historic_frequency_data/'
-tso_name = 'Nationalgrid'
+if __name__ == '__main__':
+    in_path = path_to_external_data + 'GreatBritain/nationalgrideso_historic_frequency_data/'
+    tso_name = 'Nationalgrid'
 
-correct_indices_nationalgrid(in_path, path_to_data, tso_name)
+    correct_indices_nationalgrid(in_path, path_to_data, tso_name, workers=workers, storage=storage,
+                                 dtype=dtype)
 
 
 
@@ -2,49 +2,528 @@
 Implementation od data pre-processing routines for frequency data and techno-economic features
 """
 
+from collections.abc import Mapping
+
 import numpy as np
 import pandas as pd
 import tensorflow as tf
+from numpy.lib.stride_tricks import sliding_window_view
+
+from calendar_features import index_calendar_features
+from feature_store import FeatureStore
+from frequency_store import FrequencyStore
+from normalization import StreamingNormalizer
 
 def load_data(freq, # freq_file = '../Frequency_data_preparation/TransnetBW/cleansed_2015-01-01_to_2019-12-31.h5'
-              feature_folder = '../data/GB/'):
+              feature_folder = '../data/GB/', columns=None, start=None, end=None):
     """
     Load target and feature data from file paths.
 
     Args:
-        freq_file (str, optional): File path to frequency time series data.
-        feature_folder (str, optional): Folder with feature data.
+        freq (pandas.Series or FrequencyStore): Frequency time series data. A FrequencyStore stays 
+        memory-mapped and is normalized on access.
+        feature_folder (str, optional): Folder with feature data. If the folder contains a FeatureStore, only 
+        the columns and the time range [start, end] are read from it (only the rows of input_actual.h5 for a store
+        built by FeatureStore.from_hdf). Otherwise, input_actual.h5 and input_forecast.h5 are read and joined.
+        columns (list, optional): Feature columns (default: the columns of the h5 files, i.e., without the 
+        derived columns of the FeatureStore).
+        start (str, optional): First timestamp of the features (tz-aware for a FeatureStore with tz-aware index).
+        end (str, optional): Last timestamp of the features.
 
     Returns:
         tuple: frequency data and features
     """    
     
     # Read and normalize target
-    freq = freq-50
-    freq = freq *2*np.pi # transform to angular frequency
+    if isinstance(freq, FrequencyStore):
+        freq = freq.normalized(50, 2*np.pi) # transform to angular frequency
+        freq_start = freq.start
+    else:
+        freq = freq-50
+        freq = freq *2*np.pi # transform to angular frequency
+        freq_start = freq.index[0]
     
     # Read 15min resolved features
-    features = pd.read_hdf(feature_folder+'input_actual.h5')
-    features = features.join(pd.read_hdf(feature_folder+'input_forecast.h5'))
+    if FeatureStore.exists(feature_folder):
+        store = FeatureStore.open(feature_folder)
+        rows = 'actual' if 'actual' in store.row_sets else None
+        features = store.read(store.base_columns if columns is None else columns, start, end, rows)
+    else:
+        features = pd.read_hdf(feature_folder+'input_actual.h5')
+        features = features.join(pd.read_hdf(feature_folder+'input_forecast.h5'))
+        features = features.loc[start:end] if columns is None else features.loc[start:end, columns]
 
     # series has to start at 00:00
-    assert freq.index[0].hour==0, 'frequency time series should start at 00:00'
-    assert freq.index[0].minute==0, 'frequency time series should start at 00:00'
+    assert freq_start.hour==0, 'frequency time series should start at 00:00'
+    assert freq_start.minute==0, 'frequency time series should start at 00:00'
     
     return freq, features
 
 
+class Split(Mapping):
+    """
+    Named sets of interval positions (e.g. 'train', 'val' and 'test'), which are applied to all aligned arrays
+    of a dataset with integer take. Splits are independent of the data, so that they can be reused, e.g. for
+    datasets of several configurations, and saved for reproducible runs.
+
+    Args:
+        positions (dict): Arrays of positions of each set.
+    """
+
+    def __init__(self, positions):
+        self.positions = {name: np.asarray(p, dtype=np.int64) for name, p in positions.items()}
+
+    def __getitem__(self, name):
+        return self.positions[name]
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def take(self, name, *arrays):
+        """ Rows of the arrays at the positions of the set name."""
+        return tuple(np.take(array, self.positions[name], axis=0) for array in arrays)
+
+    def restrict(self, mask):
+        """ Split with the positions where mask is True (in the same order)."""
+        return Split({name: p[mask[p]] for name, p in self.positions.items()})
+
+    def save(self, file):
+        np.savez(file, **self.positions)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as positions:
+            return cls(dict(positions))
+
+
+def select_period(index, start=None, end=None):
+    """ Boolean mask of the timestamps in index between start and end (inclusive bounds as with .loc)."""
+
+    selected = np.ones(len(index), dtype=bool)
+    if start is not None:
+        selected &= index >= pd.Timestamp(start)
+    if end is not None:
+        selected &= index <= pd.Timestamp(end)
+
+    return selected
+
+
+def date_split(index, periods, seed=0, shuffle=True):
+    """
+    Split the intervals of index into periods.
+
+    Args:
+        index (pandas.DatetimeIndex): Start times of the intervals.
+        periods (dict): (start, end) of each set, e.g. {'train': (None, '2017-12-31 23:59'), ...}.
+        seed (int, optional): Seed of the permutation of the positions. All sets are shuffled with the same
+        permutation of the index, so that the same seed gives the same order.
+        shuffle (bool, optional): Whether to shuffle the positions (otherwise in chronological order).
+
+    Returns:
+        Split: positions of the sets
+    """
+
+    order = np.random.default_rng(seed).permutation(len(index)) if shuffle else np.arange(len(index))
+
+    return Split({name: order[select_period(index, start, end)[order]] for name, (start, end) in periods.items()})
+
+
+def walk_forward_splits(index, first_train_end, test_length, step=None, n_splits=None, val_length=None,
+                        train_length=None, seed=0, shuffle=True):
+    """
+    Rolling-origin (walk-forward) splits for backtesting. The k-th split trains on the data up to
+    first_train_end + k*step (all previous data, or the last train_length for a rolling window), validates on the
+    following val_length (optional) and tests on the following test_length. The origins are moved forward
+    until the test period leaves the index or n_splits are reached.
+
+    Args:
+        index (pandas.DatetimeIndex): Start times of the intervals.
+        first_train_end (str): End of the first training period.
+        test_length (str): Length of the test periods (pandas.Timedelta string, e.g. '30D').
+        step (str, optional): Shift of the origin between the splits (default: test_length).
+        n_splits (int, optional): Maximum number of splits.
+        val_length (str, optional): Length of the validation periods between training and test.
+        train_length (str, optional): Length of the rolling training window (default: expanding window).
+        seed (int, optional): Seed of the permutations (see date_split).
+        shuffle (bool, optional): Whether to shuffle the positions.
+
+    Returns:
+        list: Split of each origin
+    """
+
+    # Small offset of the starts to obtain disjoint periods with the inclusive bounds of select_period
+    eps = pd.Timedelta(1, 'ns')
+    step = pd.Timedelta(test_length if step is None else step)
+    origin = pd.Timestamp(first_train_end)
+    splits = []
+
+    while n_splits is None or len(splits) < n_splits:
+        train_start = None if train_length is None else origin - pd.Timedelta(train_length) + eps
+        periods = {'train': (train_start, origin)}
+        test_start = origin
+        if val_length is not None:
+            periods['val'] = (origin + eps, origin + pd.Timedelta(val_length))
+            test_start = origin + pd.Timedelta(val_length)
+        periods['test'] = (test_start + eps, test_start + pd.Timedelta(test_length))
+
+        if len(index)==0 or periods['test'][1] > index.max():
+            break
+        splits.append(date_split(index, periods, seed + len(splits), shuffle))
+        origin += step
+
+    return splits
+
+
+class WindowedDataset:
+    """
+    Dataset of frequency intervals (outputs), features (inputs) and initial conditions without copies of the
+    frequency series. The outputs Y are a strided view of the frequency values, the initial conditions are only 
+    computed at the interval starts and the train, validation and test sets are given as arrays of row positions.
+    For a normalized FrequencyStore, Y is a view of the stored (raw) values and the normalization and cast to
+    the dtype of the dataset are only applied to the gathered rows (transform). Use build_windowed_dataset to
+    create it.
+
+    Args:
+        ts (tensor): 1-d tensor with time steps of one interval.
+        index (pandas.DatetimeIndex): Start times (full hours) of all intervals.
+        Y (numpy.ndarray): 2-d view of the frequency values of all intervals.
+        X (numpy.ndarray): Features of all intervals.
+        Z (numpy.ndarray): Initial conditions of all intervals.
+        feature_names (list): Names of the features (columns of X).
+        init_names (list): Names of the initial conditions (columns of Z).
+        valid (numpy.ndarray): Boolean mask of the intervals without NaNs.
+        splits (Split): Positions of the (shuffled) intervals of the 'train', 'val' and 'test' set.
+        transform (callable, optional): Function applied to the gathered rows of Y (None if Y holds the outputs).
+    """
+
+    def __init__(self, ts, index, Y, X, Z, feature_names, init_names, valid, splits, transform=None):
+        self.ts = ts
+        self.index = index
+        self.Y = Y
+        self.X = X
+        self.Z = Z
+        self.feature_names = feature_names
+        self.init_names = init_names
+        self.valid = valid
+        self.splits = splits
+        self.transform = transform
+
+    def outputs(self, positions):
+        """ Outputs of the intervals at positions (copies of the selected rows)."""
+
+        y = np.take(self.Y, positions, axis=0)
+
+        return y if self.transform is None else self.transform(y)
+
+    def gather(self, positions):
+        """ Return the arrays X, Z, y of the intervals at positions (copies of the selected rows)."""
+        return np.take(self.X, positions, axis=0), np.take(self.Z, positions, axis=0), self.outputs(positions)
+
+    def arrays(self, split):
+        """ Return the arrays X, Z, y of a split (copies of the selected rows)."""
+        return self.gather(self.splits[split])
+
+    def feature_normalizer(self, split='train', chunk_size=2**16):
+        """ StreamingNormalizer of the features of a split, computed in chunks of chunk_size intervals."""
+
+        positions = self.splits[split]
+        normalizer = StreamingNormalizer(columns=self.feature_names)
+        for i in range(0, len(positions), chunk_size):
+            normalizer.update(np.take(self.X, positions[i:i+chunk_size], axis=0))
+
+        return normalizer
+
+    def frames(self, split):
+        """ Return the data frames X, Z, y of a split as in prepare_data."""
+
+        positions = self.splits[split]
+        index = self.index[positions]
+        X, Z, y = self.arrays(split)
+
+        return (pd.DataFrame(X, index=index, columns=self.feature_names),
+                pd.DataFrame(Z, index=index, columns=self.init_names),
+                pd.DataFrame(y, index=index, columns=np.arange(self.Y.shape[1])))
+
+
+def compensated_cumsum(windows):
+    """
+    Cumulative sums along the rows of windows with Kahan compensation, i.e., with an error independent of 
+    the row length. The summation is vectorized over the rows and runs in the dtype of windows.
+    """
+
+    cumsum = np.empty(windows.shape, dtype=windows.dtype)
+    total = np.zeros(windows.shape[0], dtype=windows.dtype)
+    compensation = np.zeros_like(total)
+    for i in range(windows.shape[1]):
+        y = windows[:,i] - compensation
+        t = total + y
+        compensation = (t - total) - y
+        total = t
+        cumsum[:,i] = total
+
+    return cumsum
+
+
+class WindowGenerator:
+    """
+    Generator of aligned windowed datasets for several configurations (prediction_start, horizon, aggregation)
+    from one pass over the frequency series. The intervals start at the full hours (every n_per_inteval steps)
+    and all datasets share the features, the split of the intervals and the NaN-counts of the series. The initial 
+    conditions are computed once per prediction_start. Outputs are strided views of the frequency values 
+    (subsampling) or block means of the intervals.
+
+    All arrays are kept in custom_dtype, i.e., for 'float32' the series, outputs, features and initial 
+    conditions take half the memory. The values of a FrequencyStore stay memory-mapped, its normalization and
+    the cast to custom_dtype are only applied to the gathered windows (see transform). Sums that are prone to
+    cancellation are accumulated in float64 (block means) or with compensated summation (initial conditions),
+    see compare_precision.
+
+    Args:
+        freq (pandas.Series or FrequencyStore): frequency data time series.
+        features (pandas.DataFrame): feature data.
+        add_time_features (bool, optional): Whether to add hour and minute features.
+        n_per_inteval (int, optional): Number of time steps per interval.
+        n_theta_0 (int, optional): Number of time steps used to estimate theta initial condition.
+        n_s_omega_0 (int, optional): Number of time steps used to estimate s_omega initial condition. 
+        custom_dtype (str, optional): 'float64' or 'float32'.
+        train_end (string, optional): End of training set (format 'Year-Month-Day HH:MM')
+        val_end (string, optional): End of validation set.
+        test_end (string, optional): End of test set.
+        tz (str, optional): Time zone of the (naive) frequency index for the time features (see prepare_data).
+        seed (int, optional): Seed of the shuffled splits.
+        split (Split, optional): Split of the intervals that replaces the date split by train_end, val_end and
+        test_end, e.g. from walk_forward_splits.
+    """
+
+    def __init__(self, freq, features, add_time_features=True, n_per_inteval = 3600,
+                 n_theta_0 = 60,  n_s_omega_0 = 60, custom_dtype = 'float64',
+                 train_end='2017-12-31 23:59', val_end='2018-12-31 23:59',
+                 test_end='2019-12-31 23:59', tz=None, seed=0, split=None):
+
+        if isinstance(freq, FrequencyStore):
+            tz = freq.tz if tz is None else tz
+            self.values = freq.values
+            self.center, self.scale = freq.center, freq.scale
+            index = freq.window_index(n_per_inteval, 3600).tz_localize(None)
+        else:
+            self.values = np.asarray(freq.values, dtype=custom_dtype)
+            self.center, self.scale = 0., 1.
+            index = freq.index[3600::n_per_inteval]
+
+        self.n_per_inteval = n_per_inteval
+        self.n_theta_0 = n_theta_0
+        self.n_s_omega_0 = n_s_omega_0
+        self.custom_dtype = custom_dtype
+        self.n_intervals = (self.values.size-3600)//n_per_inteval
+        self.index = index[:self.n_intervals]
+
+        # Number of NaNs before each position (one pass over the series, shared by all windows)
+        self.nan_counts = np.concatenate([[0], np.cumsum(np.isnan(self.values), dtype=np.int32)])
+
+        # Prepare features of all intervals
+        X = features.reindex(self.index).astype(custom_dtype)
+        X = X.drop(columns=['month', 'hour', 'weekday'], errors='ignore')
+        if add_time_features:
+            # Cached calendar features of the interval grid
+            time_columns = ['hour_sin', 'hour_cos'] + (['minute_sin', 'minute_cos'] if n_per_inteval<3600 else [])
+            time_features = index_calendar_features(self.index, tz, time_columns)
+            for column in time_columns:
+                X.loc[:,column] = time_features[column].values.astype(custom_dtype)
+        self.X = X.values.astype(custom_dtype)
+        self.feature_names = list(X.columns)
+        self.valid_features = ~X.isnull().any(axis=1).values
+
+        # Split train, test and validation set (shared by all datasets)
+        if split is None:
+            split = date_split(self.index, {'train': (None, train_end), 'val': (train_end, val_end),
+                                            'test': (val_end, test_end)}, seed)
+        self.split = split
+
+        self._initial_conditions = {}
+
+    @property
+    def identity(self):
+        """ Whether the values are already normalized and in custom_dtype."""
+        return self.center == 0 and self.scale == 1 and self.values.dtype == np.dtype(self.custom_dtype)
+
+    def transform(self, windows):
+        """ Normalized windows (gathered from the values) in custom_dtype."""
+
+        if self.identity:
+            return windows
+        if self.center == 0 and self.scale == 1:
+            return np.asarray(windows, dtype=self.custom_dtype)
+
+        return np.asarray((windows - self.center) * self.scale, dtype=self.custom_dtype)
+
+    def starts(self, prediction_start=0):
+        """ Positions of the first predicted values of the intervals."""
+        return 3600-int(prediction_start*60) + self.n_per_inteval*np.arange(self.n_intervals)
+
+    def nan_count(self, starts, length):
+        """ Number of NaNs in the windows [starts, starts + length) of the series."""
+        return self.nan_counts[starts+length] - self.nan_counts[starts]
+
+    def initial_conditions(self, prediction_start=0, horizon=None):
+        """ Initial conditions at the interval starts (computed once per prediction_start). As in the outputs of
+        prepare_data, s_omega_0 is the std of the first min(n_s_omega_0, horizon) predicted values, skipping
+        NaNs."""
+
+        n_s_omega_0 = self.n_s_omega_0 if horizon is None else min(self.n_s_omega_0, horizon)
+        key = (prediction_start, n_s_omega_0)
+        if key not in self._initial_conditions:
+            starts = self.starts(prediction_start)
+            offset = starts[0] if self.n_intervals else 0
+
+            # As in the rolling windows of the shifted series, the windows must not reach before the first 
+            # predicted value
+            def window_stat(length, end_shift, stat):
+                window_starts = starts - length + end_shift
+                result = np.full(self.n_intervals, np.nan, dtype=self.custom_dtype)
+                inside = window_starts >= offset
+                windows = sliding_window_view(self.values, length)[window_starts[inside]]
+                result[inside] = stat(self.transform(windows))
+                return result
+
+            # Two-pass std of the compensated cumulative sum (no cancellation in float32)
+            def cumsum_std(windows):
+                cumsum = compensated_cumsum(windows)
+                return np.sqrt(((cumsum - cumsum.mean(1, keepdims=True))**2).sum(1)/(windows.shape[1]-1))
+
+            # Sample std skipping NaNs (as pandas), NaN for less than two values
+            def nan_std(windows):
+                valid = ~np.isnan(windows)
+                count = valid.sum(1)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    mean = np.where(valid, windows, 0).sum(1, dtype='float64')/count
+                    m2 = (np.where(valid, windows - mean[:,None], 0)**2).sum(1)
+                    return np.where(count > 1, np.sqrt(m2/(count - 1)), np.nan)
+
+            first_values = self.transform(sliding_window_view(self.values, n_s_omega_0)[starts])
+            dt = 1.  # time step
+            init_data = {
+                # sum of the n_theta_0 values before the interval start
+                'theta_0': window_stat(self.n_theta_0, 0, lambda w: compensated_cumsum(w)[:,-1])*dt,
+                'omega_0': first_values[:,0], 
+                # std of the cumulative sum in the n_theta_0 values up to the interval start
+                's_theta_0': window_stat(self.n_theta_0, 1, cumsum_std)*dt,
+                'cov_theta_omega_0': np.zeros(self.n_intervals)+1e-10,
+                's_omega_0': nan_std(first_values),
+            }
+            Z = np.stack([np.asarray(v, dtype=self.custom_dtype) for v in init_data.values()], axis=1)
+
+            self._initial_conditions[key] = Z, list(init_data.keys())
+
+        return self._initial_conditions[key]
+
+    def outputs(self, prediction_start=0, horizon=3600, aggregation=1, method='subsample', chunk_size=2**10):
+        """
+        Outputs of the intervals with horizon time steps after prediction_start, aggregated to blocks of
+        aggregation time steps. For method='subsample', the first value of each block is taken (strided view
+        of the values as [:, ::aggregation], which still has to be transformed unless identity). For 
+        method='mean', the block means of the transformed values are accumulated in float64 (in chunks of 
+        chunk_size intervals). Blocks with NaNs are NaN.
+        """
+
+        starts = self.starts(prediction_start)
+        windows = self.values[starts[0]:starts[0]+self.n_intervals*self.n_per_inteval]
+        windows = windows.reshape(self.n_intervals, self.n_per_inteval)
+        if aggregation==1 or method=='subsample':
+            return windows[:,:horizon//aggregation*aggregation:aggregation]
+        if method!='mean':
+            raise ValueError('Unknown aggregation method {}!'.format(method))
+
+        blocks = windows[:,:horizon//aggregation*aggregation].reshape(self.n_intervals, -1, aggregation)
+
+        # The windows are transformed in chunks of intervals, so that the series is never held in memory at once
+        means = np.empty(blocks.shape[:2], dtype=self.custom_dtype)
+        for i in range(0, self.n_intervals, chunk_size):
+            means[i:i+chunk_size] = self.transform(blocks[i:i+chunk_size]).mean(2, dtype='float64')
+
+        return means
+
+    def dataset(self, prediction_start=0, horizon=3600, aggregation=1, method='subsample', split=None):
+        """
+        Windowed dataset of one configuration.
+
+        Args:
+            prediction_start (int, optional): Start of predicted intervals in minutes before full hour.
+            horizon (int, optional): Number of predicted time steps (n_prediction_steps of prepare_data).
+            aggregation (int, optional): Number of time steps per output (block).
+            method (str, optional): 'subsample' or 'mean' aggregation of the blocks.
+            split (Split, optional): Split of the intervals (default: split of the generator).
+
+        Returns:
+            WindowedDataset: dataset with splits
+        """
+
+        assert prediction_start<15, 'Prediction start has to be smaller than 15 min!'
+        assert horizon<=self.n_per_inteval, 'The horizon has to be shorter than the interval!'
+
+        Y = self.outputs(prediction_start, horizon, aggregation, method)
+        Z, init_names = self.initial_conditions(prediction_start, horizon)
+        starts = self.starts(prediction_start)
+
+        # Intervals without NaNs
+        valid = (self.nan_count(starts, horizon)==0) & ~np.isnan(Z).any(1) & self.valid_features
+        assert ~(Z[valid, init_names.index('s_omega_0')]==0).any(), "s_omega should not contain zeros"
+        assert ~(Z[valid, init_names.index('s_theta_0')]==0).any(), "s_theta should not contain zeros"
+        splits = (self.split if split is None else split).restrict(valid)
+
+        dt = 1.  # time step
+        ts = tf.constant(np.arange(0,dt*(horizon//aggregation*aggregation), dt*aggregation).astype(self.custom_dtype))
+
+        transform = None if self.identity or (aggregation>1 and method=='mean') else self.transform
+
+        return WindowedDataset(ts, self.index, Y, self.X, Z, self.feature_names, init_names, valid, splits,
+                               transform)
+
+    def datasets(self, configs):
+        """ Windowed datasets of several configurations, given as tuples or dicts of the arguments of dataset."""
+        return [self.dataset(**config) if isinstance(config, dict) else self.dataset(*config) for config in configs]
+
+
+def build_windowed_dataset(freq, features, add_time_features=True,
+                           prediction_start=0, n_prediction_steps=3600, n_per_inteval = 3600,
+                           n_theta_0 = 60,  n_s_omega_0 = 60, custom_dtype = 'float64',
+                           train_end='2017-12-31 23:59', val_end='2018-12-31 23:59',
+                           test_end='2019-12-31 23:59', tz=None, seed=0):
+    """
+    Prepare outputs, inputs and initial conditions as in prepare_data, but without copying the frequency series.
+    The outputs are a strided view of the frequency values, the initial conditions are computed only at the
+    interval starts and the valid intervals are found from the NaN-counts of each interval. Use WindowGenerator
+    directly to prepare several configurations. 
+
+    Args:
+        freq (pandas.Series or FrequencyStore): frequency data time series.
+        features (pandas.DataFrame): feature data.
+        For the other arguments, see prepare_data.
+
+    Returns:
+        WindowedDataset: dataset with splits
+    """            
+    
+    generator = WindowGenerator(freq, features, add_time_features, n_per_inteval, n_theta_0, n_s_omega_0,
+                                custom_dtype, train_end, val_end, test_end, tz, seed)
+
+    return generator.dataset(prediction_start, n_prediction_steps)
+
+
 def prepare_data(freq, features, add_time_features=True,
                  prediction_start=0, n_prediction_steps=3600, n_per_inteval = 3600,
                  n_theta_0 = 60,  n_s_omega_0 = 60, custom_dtype = 'float64',
                  train_end='2017-12-31 23:59', val_end='2018-12-31 23:59',
-                 test_end='2019-12-31 23:59'):
+                 test_end='2019-12-31 23:59', tz=None, seed=0):
     """
     Prepare data frames of inputs, outputs and initial conditions. Outputs are created by reshaping the frequency
-    time series into intervals, i.e., vectors, for each input instance. 
+    time series into intervals, i.e., vectors, for each input instance. The data is prepared with 
+    build_windowed_dataset and only the rows of the splits are copied to the data frames.
 
     Args:
-        freq (pandas.Series): frequency data time series.
+        freq (pandas.Series or FrequencyStore): frequency data time series.
         features (pandas.DataFrame): feature data.
         add_time_features (bool, optional): Whether to add hour and minute features.
         prediction_start (int, optional): Start of predicted intervals in minutes before full hour.
@@ -56,81 +535,124 @@ def prepare_data(freq, features, add_time_features=True,
         train_end (string, optional): End of training set (format 'Year-Month-Day HH:MM')
         val_end (string, optional): End of validation set.
         test_end (string, optional): End of test set.
-
+        tz (str, optional): Time zone of the (naive) frequency index for the time features. By default, the time
+        zone of a FrequencyStore is used and the index of a Series is interpreted as local time.
+        seed (int, optional): Seed of the shuffled splits (the same seed gives the same splits).
 
     Returns:
         tuple: tensor with time steps, dictionary of prepared data
     """            
     
-    # Select start of predicted intervals 
-    assert prediction_start<15, 'Prediction start has to be smaller than 15 min!'
-    if prediction_start==0:
-        freq_shifted = freq.iloc[3600:].copy()
-    else:
-        freq_shifted = freq.iloc[3600-int(prediction_start*60):-int(prediction_start*60)].copy()
-
-    # Initialize time steps 
-    dt = 1.  # time step
-    interval_index = freq.index[3600::n_per_inteval]
-    ts = tf.constant(np.arange(0,dt*n_prediction_steps, dt).astype(custom_dtype)) # time steps for ML model 
-
-    # Prepare frequency data by reshaping
-    Y = freq_shifted.values.astype(custom_dtype).reshape((freq_shifted.shape[0]//n_per_inteval,
-                                                          n_per_inteval))
-    Y = pd.DataFrame(data=Y[:,:n_prediction_steps],
-                     index = interval_index,
-                     columns=np.arange(n_prediction_steps))
-
-
-    # Extract initial conditions     
-    init_data = {
-        'theta_0': freq_shifted.rolling(n_theta_0, closed='left').sum().iloc[::n_per_inteval].values*dt,
-        'omega_0': Y.iloc[:,0].values, 
-        's_theta_0': freq_shifted.cumsum().rolling(n_theta_0).std().iloc[::n_per_inteval].values*dt,
-        'cov_theta_omega_0': np.zeros(Y.shape[0])+1e-10,
-        's_omega_0': Y.iloc[:,:n_s_omega_0].std(1).values,
-    }
-    Z = pd.DataFrame(index = interval_index,
-                     data=init_data,
-                     dtype=custom_dtype)
-
-    # Prepare features
-    X = features.reindex(Y.index).astype(custom_dtype)
-    X = X.drop(columns=['month', 'hour', 'weekday'], errors='ignore')
-    if add_time_features:
-        X.loc[:,'hour_sin'] = np.sin((X.index.hour + X.index.minute/60)/24*2*np.pi)
-        X.loc[:,'hour_cos'] = np.cos((X.index.hour + X.index.minute/60)/24*2*np.pi)
-        if n_per_inteval<3600:
-            X.loc[:,'minute_sin'] = np.sin((X.index.minute)/60*2*np.pi)
-            X.loc[:,'minute_cos'] = np.cos((X.index.minute)/60*2*np.pi)
-
-    # Remove intervals with NaNs
-    valid_ind = ~pd.concat([X, Y, Z], axis=1).isnull().any(axis=1)
-    Y,X, Z = Y[valid_ind], X[valid_ind], Z[valid_ind]
-
-
-    assert ~(Z.s_omega_0==0).any(), "s_omega should not contain zeros"
-    assert ~(Z.s_theta_0==0).any(), "s_theta should not contain zeros"
-
-    # Split train, test and validation set
-    X_train = X.loc[:train_end].sample(frac=1)
-    Z_train = Z.loc[X_train.index]
-    y_train = Y.loc[X_train.index]
-    
-    X_val = X.loc[train_end:val_end].sample(frac=1)
-    Z_val = Z.loc[X_val.index]
-    y_val = Y.loc[X_val.index]
-    
-    X_test = X.loc[val_end:test_end].sample(frac=1)
-    Z_test = Z.loc[X_test.index]
-    y_test = Y.loc[X_test.index]    
-    
-    data = {'X_train':X_train, 'Z_train':Z_train, 'y_train':y_train,
-            'X_val':X_val, 'Z_val':Z_val, 'y_val':y_val,
-            'X_test':X_test, 'Z_test':Z_test, 'y_test':y_test}
+    dataset = build_windowed_dataset(freq, features, add_time_features, prediction_start, n_prediction_steps,
+                                     n_per_inteval, n_theta_0, n_s_omega_0, custom_dtype, train_end, val_end,
+                                     test_end, tz, seed)
+
+    data = {}
+    for split in ['train', 'val', 'test']:
+        data['X_'+split], data['Z_'+split], data['y_'+split] = dataset.frames(split)
     
-    return ts, data
+    return dataset.ts, data
+
+
+def compare_precision(freq, features, configs=((0, 3600, 1),), **kwargs):
+    """
+    Validation report of the float32 mode against the float64 path. Both generators prepare the datasets of
+    configs and the deviations of the float32 arrays (outputs, features and initial conditions) are reported 
+    per column on the valid intervals.
+
+    Args:
+        freq (pandas.Series or FrequencyStore): frequency data time series.
+        features (pandas.DataFrame): feature data.
+        configs (list, optional): Configurations of WindowGenerator.dataset (tuples or dicts).
+        kwargs: Other arguments of WindowGenerator (except custom_dtype).
 
+    Returns:
+        pandas.DataFrame: max. absolute and relative (to the max. absolute value) error and the memory of both 
+        dtypes for each config and array
+    """
+
+    generators = [WindowGenerator(freq, features, custom_dtype=dtype, **kwargs) for dtype in ('float64', 'float32')]
+    report = []
+    for config, (reference, single) in zip(configs, zip(*[g.datasets(configs) for g in generators])):
+        valid = reference.valid
+        positions = np.arange(len(reference.Y))
+        arrays = [('Y', reference.outputs(positions), single.outputs(positions), ['Y'])]
+        arrays += [('X', reference.X, single.X, reference.feature_names)]
+        arrays += [('Z', reference.Z, single.Z, reference.init_names)]
+        for name, x, y, columns in arrays:
+            x, y = np.asarray(x)[valid], np.asarray(y)[valid].astype('float64')
+            if name=='Y':
+                x, y = x.reshape(-1, 1), y.reshape(-1, 1)
+            error = np.abs(x - y).max(0, initial=0.)
+            scale = np.abs(x).max(0, initial=0.)
+            for i, column in enumerate(columns):
+                report.append({'config': str(config), 'array': name, 'column': column,
+                               'max_abs_error': error[i], 
+                               'max_rel_error': error[i]/scale[i] if scale[i]>0 else 0.,
+                               'bytes_float64': x[:,i].nbytes, 'bytes_float32': x[:,i].nbytes//2})
+
+    return pd.DataFrame(report)
+
+
+def make_tf_dataset(freq, features, split, batch_size, shuffle=True, with_initial_conditions=True, datasets=None,
+                    **kwargs):
+    """
+    Streaming tf.data input pipeline for a split of the windowed dataset(s). Only the positions of the intervals
+    are shuffled and batched. The intervals of each batch are then cut from the frequency values and joined with
+    the features (precomputed at the interval starts) in parallel to the training, so that the complete
+    output matrix is never materialized.
+
+    Args:
+        freq (pandas.Series, FrequencyStore or list): frequency data time series, or a list of series of several
+        TSOs (e.g. GB, DE and FI) with the same features, which are mixed in the shuffled batches.
+        features (pandas.DataFrame or list): feature data (one data frame per frequency time series).
+        split (str): 'train', 'val' or 'test'.
+        batch_size (int): Number of intervals per batch.
+        shuffle (bool, optional): Whether to reshuffle the intervals in each epoch.
+        with_initial_conditions (bool, optional): Whether the inputs contain the initial conditions, i.e., the 
+        elements are ((X, Z), y) instead of (X, y).
+        datasets (list, optional): WindowedDatasets from build_windowed_dataset to reuse instead of building them
+        from freq and features.
+        kwargs: Arguments of build_windowed_dataset.
+
+    Returns:
+        tf.data.Dataset: batched and prefetched dataset
+    """
+
+    if datasets is None:
+        if not isinstance(freq, (list, tuple)):
+            freq, features = [freq], [features]
+        datasets = [build_windowed_dataset(f, x, **kwargs) for f, x in zip(freq, features)]
+
+    assert all(d.feature_names==datasets[0].feature_names for d in datasets), 'The features have to be the same!'
+
+    # Positions of the intervals of the split together with the number of their dataset
+    ids = np.concatenate([np.full(len(d.splits[split]), i) for i, d in enumerate(datasets)])
+    positions = np.concatenate([d.splits[split] for d in datasets])
+    dtype = datasets[0].X.dtype
+    n_features, n_init, n_steps = datasets[0].X.shape[1], datasets[0].Z.shape[1], datasets[0].Y.shape[1]
+
+    def gather(batch_ids, batch_positions):
+        batch = [np.empty((len(batch_ids), n), dtype=dtype) for n in (n_features, n_init, n_steps)]
+        for i, d in enumerate(datasets):
+            selected = batch_ids==i
+            for out, values in zip(batch, d.gather(batch_positions[selected])):
+                out[selected] = values
+        return batch
+
+    def load_batch(batch_ids, batch_positions):
+        X, Z, y = tf.numpy_function(gather, [batch_ids, batch_positions], [tf.as_dtype(dtype)]*3)
+        X.set_shape([None, n_features])
+        Z.set_shape([None, n_init])
+        y.set_shape([None, n_steps])
+        return ((X, Z), y) if with_initial_conditions else (X, y)
+
+    ds = tf.data.Dataset.from_tensor_slices((ids, positions))
+    if shuffle:
+        ds = ds.shuffle(len(positions), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(load_batch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+
+    return ds.prefetch(tf.data.AUTOTUNE)
 
 
 def prepare_fixed_hps(features,
@@ -143,7 +665,8 @@ def prepare_fixed_hps(features,
     Prepare fixed hyperparameters (not optimized) for PIML model.
 
     Args:
-        features (pandas.DataFrame): Feature data . Should be from training set.
+        features (pandas.DataFrame or StreamingNormalizer): Feature data or their normalizer, e.g. from
+        WindowedDataset.feature_normalizer. Should be from training set.
         ts (tensor): 1-d tensor with time steps of one interval.
         param_scalings (list): List of scaling parameters for dynamical system parameters and
         initial conditions. Note that scaling can also be defined for cov_0 and tau, but they are not not applied!
@@ -157,13 +680,19 @@ def prepare_fixed_hps(features,
     """
 
 
+    # Mean and sample variance of the features as in pandas
+    if isinstance(features, StreamingNormalizer):
+        normalizer = features
+    else:
+        normalizer = StreamingNormalizer().update(features)
+
     fixed_model_hps = {
         'param_scalings': tf.constant(param_scalings, dtype=custom_dtype), 
         'power_step':power_step,
         'vmin':tf.constant(vmins, dtype=custom_dtype),  
         'ts':ts,
-        'feature_mean':features.mean(0).values,#needs to by numpy array!
-        'feature_var':features.var(0).values,#needs to by numpy array!
+        'feature_mean':normalizer.mean.astype(custom_dtype),#needs to by numpy array!
+        'feature_var':normalizer.var(ddof=1).astype(custom_dtype),#needs to by numpy array!
     }
 
     return fixed_model_hps
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+Content-addressed disk cache of prepared (windowed) datasets
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from data_prep import Split, WindowedDataset, build_windowed_dataset, load_data
+from feature_store import FILE as FEATURE_FILE, FeatureStore
+from frequency_store import FrequencyStore
+
+# Increase to invalidate all entries after changes of the data preparation
+CACHE_VERSION = 3
+
+ARRAYS = ['Y', 'X', 'Z', 'index', 'valid', 'ts']
+
+
+def file_fingerprint(path):
+    """ Metadata (path, size, modification time) of a file or of all files in a folder."""
+
+    if os.path.isdir(path):
+        return [file_fingerprint(os.path.join(path, name)) for name in sorted(os.listdir(path))]
+    stat = os.stat(path)
+
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+class DatasetCache:
+    """
+    Disk cache of WindowedDatasets. Entries are addressed by a hash of the metadata of the input files and all
+    arguments of the preparation, and the arrays are stored as .npy files that are memory-mapped on a hit. The
+    least recently used entries are removed if the cache exceeds max_bytes.
+
+    Args:
+        folder (str): Folder of the cache.
+        max_bytes (int, optional): Disk budget of the cache.
+    """
+
+    def __init__(self, folder, max_bytes=50*2**30):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, input_files, **kwargs):
+        """ Hash of the metadata of the input files (or folders) and the arguments."""
+
+        content = {'version': CACHE_VERSION, 'inputs': [file_fingerprint(file) for file in input_files],
+                   'arguments': kwargs}
+
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load(self, key):
+        """ Return the memory-mapped dataset of key or None if it is not cached."""
+
+        path = os.path.join(self.folder, key)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        # Mark the entry as recently used
+        os.utime(os.path.join(path, 'meta.json'))
+
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ARRAYS}
+        splits = Split({split: np.load(os.path.join(path, 'split_' + split + '.npy')) for split in meta['splits']})
+        index = pd.DatetimeIndex(arrays['index'].view('datetime64[ns]'))
+
+        return WindowedDataset(tf.constant(np.array(arrays['ts'])), index, arrays['Y'], arrays['X'], arrays['Z'],
+                               meta['feature_names'], meta['init_names'], arrays['valid'], splits)
+
+    def store(self, key, dataset, chunk_size=2**12):
+        """ Store the dataset under key and remove least recently used entries if the budget is exceeded."""
+
+        path = os.path.join(self.folder, key)
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        arrays = {'X': dataset.X, 'Z': dataset.Z, 'valid': dataset.valid, 'ts': np.asarray(dataset.ts),
+                  'index': dataset.index.values.astype('datetime64[ns]').view(np.int64)}
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(values))
+        # The (transformed) outputs are written in chunks of rows
+        Y = np.lib.format.open_memmap(os.path.join(tmp_path, 'Y.npy'), mode='w+', dtype=dataset.X.dtype,
+                                      shape=dataset.Y.shape)
+        for i in range(0, len(Y), chunk_size):
+            Y[i:i + chunk_size] = dataset.outputs(np.arange(i, min(i + chunk_size, len(Y))))
+        Y.flush()
+        del Y
+        for split, positions in dataset.splits.items():
+            np.save(os.path.join(tmp_path, 'split_' + split + '.npy'), positions)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'feature_names': dataset.feature_names, 'init_names': dataset.init_names,
+                       'splits': list(dataset.splits), 'created': time.time()}, f, indent=1)
+
+        # The entry is only visible after it is complete
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        self.evict(keep=key)
+
+    def entries(self):
+        """ List of (last access time, size in bytes, key) of the entries."""
+
+        entries = []
+        for key in os.listdir(self.folder):
+            path = os.path.join(self.folder, key)
+            if key.endswith('.tmp') or not os.path.exists(os.path.join(path, 'meta.json')):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            entries.append((os.path.getmtime(os.path.join(path, 'meta.json')), size, key))
+
+        return entries
+
+    def evict(self, keep=None):
+        """ Remove the least recently used entries (except keep) until the cache fits into max_bytes."""
+
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+            total -= size
+
+
+def cached_windowed_dataset(cache, freq_path, feature_folder='../data/GB/', **kwargs):
+    """
+    Load and prepare the windowed dataset of a FrequencyStore and the features in feature_folder (see load_data
+    and build_windowed_dataset) or serve it from the cache. Since the splits are stored with the dataset,
+    repeated calls return the same (shuffled) splits.
+
+    Args:
+        cache (DatasetCache): cache of prepared datasets.
+        freq_path (str): Folder of the FrequencyStore.
+        feature_folder (str, optional): Folder with feature data.
+        kwargs: Arguments of build_windowed_dataset.
+
+    Returns:
+        WindowedDataset: memory-mapped dataset with splits
+    """
+
+    # The key includes the default values, so that changed defaults do not hit old entries
+    arguments = inspect.signature(build_windowed_dataset).bind(None, None, **kwargs)
+    arguments.apply_defaults()
+    arguments = {name: value for name, value in arguments.arguments.items() if name not in ('freq', 'features')}
+
+    if FeatureStore.exists(feature_folder):
+        input_files = [freq_path, os.path.join(feature_folder, FEATURE_FILE)]
+    else:
+        input_files = [freq_path, feature_folder + 'input_actual.h5', feature_folder + 'input_forecast.h5']
+    key = cache.key(input_files, **arguments)
+
+    dataset = cache.load(key)
+    if dataset is None:
+        freq, features = load_data(FrequencyStore.open(freq_path), feature_folder)
+        cache.store(key, build_windowed_dataset(freq, features, **kwargs))
+        dataset = cache.load(key)
+
+    return dataset
+
+
+def cached_prepare_data(cache, freq_path, feature_folder='../data/GB/', **kwargs):
+    """ Cached version of prepare_data for a FrequencyStore (see cached_windowed_dataset). Returns the same tuple
+    of time steps and data frames of the splits."""
+
+    dataset = cached_windowed_dataset(cache, freq_path, feature_folder, **kwargs)
+
+    data = {}
+    for split in ['train', 'val', 'test']:
+        data['X_'+split], data['Z_'+split], data['y_'+split] = dataset.frames(split)
+
+    return dataset.ts, data
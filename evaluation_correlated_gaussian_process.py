@@ -1,15 +1,16 @@
-import joblib
 import matplotlib.pyplot as plt
 import matplotlib.transforms as mtransforms
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from keras.models import load_model
 
+from conditional_gaussian import SharedKernelConditioner
 from loss_functions import correlated_gaussian_loss
-from proper_scoring_rule import calculate_negative_log_likelihood, calculate_negative_log_likelihood_multi_gaussian, \
-    energy_scores_for_multiple_ys_and_gaussians
-from utilities import prepare_covariance_matrix, compute_conditional_stats
+from model_inference import InferenceRunner
+from normalization import load_normalizer
+from proper_scoring_rule import calculate_negative_log_likelihood
+from structured_covariance import DiagonalCovariance, ScaledKernelCovariance, energy_scores, negative_log_likelihood
+from utilities import prepare_covariance_matrix
 
 plt.rcParams['font.size'] = 12
 plt.rcParams['axes.titlesize'] = 12
@@ -31,7 +32,7 @@ frequency_test = frequency_test.loc[common_index]
 day_ahead_features_test_np = day_ahead_features_test.to_numpy()
 frequency_test_np = frequency_test.to_numpy()
 inputs_test = day_ahead_features_test_np
-scaler = joblib.load(f"trained_models/scaler.gz")
+scaler = load_normalizer("trained_models/scaler.gz")
 inputs_test = scaler.transform(inputs_test)
 
 # Frequency Deviation
@@ -45,65 +46,59 @@ covariance_matrix_rq = prepare_covariance_matrix(N, kernel_type='RationalQuadrat
 loss_eq = {"loss": correlated_gaussian_loss(N, covariance_matrix_eq)}
 loss_rq = {"loss": correlated_gaussian_loss(N, covariance_matrix_rq)}
 
-# standard with transformer
-model_rational_quadratic = load_model(f"trained_models/correlated_gaussian_rational_quadratic",
-                                      custom_objects=loss_rq)
-model_exponentiated_quadratic = load_model(f"trained_models/correlated_gaussian_Exponentiated_Quadratic",
-                                           custom_objects=loss_eq)
+# standard with transformer (loaded lazily, the raw outputs are cached in trained_models/predictions)
+runner = InferenceRunner()
+path_rational_quadratic = "trained_models/correlated_gaussian_rational_quadratic"
+path_exponentiated_quadratic = "trained_models/correlated_gaussian_Exponentiated_Quadratic"
 
-# model_rational_quadratic = load_model(f"trained_models/correlated_gaussian_rational_quadratic_GRU",
-#                                       custom_objects=loss_rq)
-# model_exponentiated_quadratic = load_model(f"trained_models/correlated_gaussian_Exponentiated_Quadratic_GRU",
-#                                            custom_objects=loss_eq)
-model_transformer_gaussian = load_model(f"trained_models/transformer_gaussian_15s")
+# path_rational_quadratic = "trained_models/correlated_gaussian_rational_quadratic_GRU"
+# path_exponentiated_quadratic = "trained_models/correlated_gaussian_Exponentiated_Quadratic_GRU"
 
 outputs_test_angular_frequency = outputs_test.astype(np.float32) * (2 * np.pi)
 
 outputs_test_angular_frequency = outputs_test_angular_frequency[:, ::aggregation]
 
-predictions_rational_quadratic = model_rational_quadratic.predict(inputs_test)
-predictions_exponentiated_quadratic = model_exponentiated_quadratic.predict(inputs_test)
+predictions_rational_quadratic = runner.predict(path_rational_quadratic, inputs_test, custom_objects=loss_rq)
+predictions_exponentiated_quadratic = runner.predict(path_exponentiated_quadratic, inputs_test, custom_objects=loss_eq)
 
 mu_rational_quadratic = 2 * np.pi * predictions_rational_quadratic[:, :N]
 mu_exponentiated_quadratic = 2 * np.pi * predictions_exponentiated_quadratic[:, :N]
 
-sigma2_rational_quadratic = (2 * np.pi) ** 2 * tf.math.sigmoid(predictions_rational_quadratic[:, N:])
-sigma2_rational_quadratic = np.array(sigma2_rational_quadratic).reshape(-1, 1, 1)
-sigma2_rational_quadratic = np.array(sigma2_rational_quadratic) * covariance_matrix_rq
+# the covariance matrices are the shared kernel matrices scaled per sample
+scale_rational_quadratic = np.array((2 * np.pi) ** 2 * tf.math.sigmoid(predictions_rational_quadratic[:, N:])).ravel()
+sigma2_rational_quadratic = ScaledKernelCovariance(scale_rational_quadratic, covariance_matrix_rq)
 
-sigma2_exponentiated_quadratic = (2 * np.pi) ** 2 * tf.math.sigmoid(predictions_exponentiated_quadratic[:, N:])
-sigma2_exponentiated_quadratic = np.array(sigma2_exponentiated_quadratic).reshape(-1, 1, 1)
-sigma2_exponentiated_quadratic = np.array(sigma2_exponentiated_quadratic) * covariance_matrix_eq
+scale_exponentiated_quadratic = np.array(
+    (2 * np.pi) ** 2 * tf.math.sigmoid(predictions_exponentiated_quadratic[:, N:])).ravel()
+sigma2_exponentiated_quadratic = ScaledKernelCovariance(scale_exponentiated_quadratic, covariance_matrix_eq)
 
-predictions_test_transformer = model_transformer_gaussian.predict(inputs_test)
+predictions_test_transformer = runner.predict("trained_models/transformer_gaussian_15s", inputs_test)
 mu_test_transformer = 2 * np.pi * predictions_test_transformer[:, :240]
 sigma_test_transformer = 2 * np.pi * tf.math.softplus(predictions_test_transformer[:, 240:])
 
-squared_sigmas = sigma_test_transformer ** 2
-cov_matrices = np.zeros(
-    (sigma_test_transformer.shape[0], sigma_test_transformer.shape[1], sigma_test_transformer.shape[1]))
-np.einsum('ij,jk->ijk', squared_sigmas, np.eye(sigma_test_transformer.shape[1]), out=cov_matrices)
+squared_sigmas = np.array(sigma_test_transformer) ** 2
+cov_matrices = DiagonalCovariance(squared_sigmas)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
 # scoring rule
 # negative log likelihood
-nll_rq = calculate_negative_log_likelihood_multi_gaussian(outputs_test_angular_frequency, mu_rational_quadratic,
-                                                          sigma2_rational_quadratic)
-nll_eq = calculate_negative_log_likelihood_multi_gaussian(outputs_test_angular_frequency, mu_exponentiated_quadratic,
-                                                          sigma2_exponentiated_quadratic)
+nll_rq = negative_log_likelihood(outputs_test_angular_frequency, mu_rational_quadratic, sigma2_rational_quadratic)
+nll_eq = negative_log_likelihood(outputs_test_angular_frequency, mu_exponentiated_quadratic,
+                                 sigma2_exponentiated_quadratic)
 nll_indp = calculate_negative_log_likelihood(mu_test_transformer, sigma_test_transformer,
                                              outputs_test_angular_frequency)
 
 #
 # energy score
-e_rq = np.median(energy_scores_for_multiple_ys_and_gaussians(outputs_test_angular_frequency, mu_rational_quadratic,
-                                                             sigma2_rational_quadratic, m=100))# m = 1000, 2000, 3000
-e_eq = np.median(energy_scores_for_multiple_ys_and_gaussians(outputs_test_angular_frequency, mu_exponentiated_quadratic,
-                                                             sigma2_exponentiated_quadratic, m=100))
-e_indp = np.median(
-    energy_scores_for_multiple_ys_and_gaussians(outputs_test_angular_frequency, mu_test_transformer, cov_matrices,
-                                                m=100))
+# unbiased O(m) estimator of E||X - X'||, so that m = 3000 samples are feasible for the whole test set
+m = 3000
+e_rq = np.median(energy_scores(outputs_test_angular_frequency, mu_rational_quadratic, sigma2_rational_quadratic,
+                               m=m, estimator='fair'))
+e_eq = np.median(energy_scores(outputs_test_angular_frequency, mu_exponentiated_quadratic,
+                               sigma2_exponentiated_quadratic, m=m, estimator='fair'))
+e_indp = np.median(energy_scores(outputs_test_angular_frequency, mu_test_transformer, cov_matrices, m=m,
+                                 estimator='fair'))
 
 results = pd.DataFrame({
     'Model': ['Rational Quadratic', 'Exponentiated Quadratic', 'Independent'],
@@ -115,39 +110,17 @@ results = pd.DataFrame({
 
 # -----------------------------------------------------------------------------------------------------------------------
 # fig
-# conditional prediction
+# conditional prediction: mean and std of each time step given the actual values of the previous time steps,
+# computed for all test hours at once with one Cholesky factor per kernel
+conditional_rational = SharedKernelConditioner(covariance_matrix_rq).sequential(
+    mu_rational_quadratic, outputs_test_angular_frequency, scale_rational_quadratic)
+conditional_exponential = SharedKernelConditioner(covariance_matrix_eq).sequential(
+    mu_exponentiated_quadratic, outputs_test_angular_frequency, scale_exponentiated_quadratic)
+
 prediction_sample_time = []
 prediction_sample_time.append(day_ahead_features_test.index.get_loc('2019-11-20 01:00:00'))
 prediction_sample_time.append(day_ahead_features_test.index.get_loc('2019-03-06 18:00:00'))
 
-feature_input = []
-true_output = []
-prediction_rational_quadratic = []
-prediction_exponentiated_quadratic = []
-mu_rational_quadratic = []
-sigma2_rational_quadratic = []
-
-mu_exponentiated_quadratic = []
-sigma2_exponentiated_quadratic = []
-
-len_outputs = outputs_test_angular_frequency.shape[1]
-for i in range(len(prediction_sample_time)):
-    position = prediction_sample_time[i]
-    feature_input.append(inputs_test[position, :].reshape(1, 14))
-    true_output.append(outputs_test_angular_frequency[position, :].reshape(len_outputs, 1))
-
-    prediction_rational_quadratic.append(model_rational_quadratic.predict(feature_input[i]))
-    mu_rational_quadratic.append(np.array(2 * np.pi * prediction_rational_quadratic[i][0, :N].reshape(N, 1)).ravel())
-    sigma2_rational_quadratic.append(np.array(np.array(
-        (2 * np.pi) ** 2 * tf.math.sigmoid(prediction_rational_quadratic[i][0, N:])).ravel() * covariance_matrix_rq))
-
-    prediction_exponentiated_quadratic.append(model_exponentiated_quadratic.predict(feature_input[i]))
-    mu_exponentiated_quadratic.append(
-        np.array(2 * np.pi * prediction_exponentiated_quadratic[i][0, :N].reshape(N, 1)).ravel())
-    sigma2_exponentiated_quadratic.append(np.array(np.array(
-        (2 * np.pi) ** 2 * tf.math.sigmoid(
-            prediction_exponentiated_quadratic[i][0, N:])).ravel() * covariance_matrix_eq))
-
 time_steps = np.arange(240)
 
 N = len(time_steps)
@@ -161,28 +134,23 @@ for i in range(2):
         trans = mtransforms.ScaledTranslation(0, 0.15, fig.dpi_scale_trans)
         axs[i, j].text(0.0, 1.0, labels[i * 2 + j], transform=axs[i, j].transAxes + trans,
                        fontsize=10, verticalalignment='top')
-        
-    # Calculation for rational_quadratic
-    syn_data_conditional_rational = compute_conditional_stats(mu_rational_quadratic[i], sigma2_rational_quadratic[i],
-                                                              true_output[i])
-    axs[i, 0].plot(time_steps, true_output[i].reshape(N, 1), label='Actual Data', color='green', linewidth=2)
-    axs[i, 0].plot(time_steps, syn_data_conditional_rational[:, 0], label='Rational Quadratic', color='blue',
-                   linewidth=2)
-    axs[i, 0].fill_between(time_steps, syn_data_conditional_rational[:, 0] - syn_data_conditional_rational[:, 1],
-                           syn_data_conditional_rational[:, 0] + syn_data_conditional_rational[:, 1], color='blue',
-                           alpha=0.2, linewidth=2)
+
+    position = prediction_sample_time[i]
+    true_output = outputs_test_angular_frequency[position, :]
+
+    # rational_quadratic
+    mean, std = conditional_rational[0][position], conditional_rational[1][position]
+    axs[i, 0].plot(time_steps, true_output, label='Actual Data', color='green', linewidth=2)
+    axs[i, 0].plot(time_steps, mean, label='Rational Quadratic', color='blue', linewidth=2)
+    axs[i, 0].fill_between(time_steps, mean - std, mean + std, color='blue', alpha=0.2, linewidth=2)
     axs[i, 0].set_xlabel('Time')
     axs[i, 0].set_ylabel(r'$\omega\, (\text{rad/s})$')
 
-    # Calculation for exponentiated_quadratic
-    syn_data_conditional_exponential = compute_conditional_stats(mu_exponentiated_quadratic[i],
-                                                                 sigma2_exponentiated_quadratic[i], true_output[i])
-    axs[i, 1].plot(time_steps, true_output[i].reshape(N, 1), label='Actual Data', color='green', linewidth=2)
-    axs[i, 1].plot(time_steps, syn_data_conditional_exponential[:, 0], label='Exponentiated Quadratic', color='orange',
-                   linewidth=2)
-    axs[i, 1].fill_between(time_steps, syn_data_conditional_exponential[:, 0] - syn_data_conditional_exponential[:, 1],
-                           syn_data_conditional_exponential[:, 0] + syn_data_conditional_exponential[:, 1],
-                           color='orange', alpha=0.2, linewidth=2)
+    # exponentiated_quadratic
+    mean, std = conditional_exponential[0][position], conditional_exponential[1][position]
+    axs[i, 1].plot(time_steps, true_output, label='Actual Data', color='green', linewidth=2)
+    axs[i, 1].plot(time_steps, mean, label='Exponentiated Quadratic', color='orange', linewidth=2)
+    axs[i, 1].fill_between(time_steps, mean - std, mean + std, color='orange', alpha=0.2, linewidth=2)
     axs[i, 1].set_xlabel('Time')
     axs[i, 1].set_ylabel(r'$\omega\, (\text{rad/s})$')
 
@@ -1,12 +1,13 @@
-import joblib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from keras.models import load_model
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 
+from closed_form_scores import crps, interval_score, log_score
 from loss_functions import gaussian_loss, student_loss, cauchy_loss
+from model_inference import InferenceRunner
+from normalization import load_normalizer
+from point_evaluation import evaluate_point_predictions
 from proper_scoring_rule import crps_norm, calculate_negative_log_likelihood, histogram_of_realized_quantiles, calibration_plot
 
 
@@ -29,7 +30,7 @@ frequency_test_np = frequency_test.to_numpy()
 
 inputs_test = day_ahead_features_test_np
 
-scaler = joblib.load(f"trained_models/scaler.gz")
+scaler = load_normalizer("trained_models/scaler.gz")
 inputs_test = scaler.transform(inputs_test)
 
 outputs_test = frequency_test_np - 50.0
@@ -38,13 +39,12 @@ outputs_test = frequency_test_np - 50.0
 #time_eval = 900 # the first 15 minutes
 time_eval = 900 # the whole hour
 
-# load models
+# load models (lazily) and predict, the raw outputs are cached in trained_models/predictions
 loss = {"loss": gaussian_loss}
-model_transformer_gaussian = load_model(f"trained_models/transformer_gaussian")
-model_gru_gaussian = load_model(f"trained_models/gru_gaussian")
+runner = InferenceRunner()
 outputs_test_angular_frequency = outputs_test.astype(np.float32) * (2 * np.pi)
-predictions_test_gru = model_gru_gaussian.predict(inputs_test)
-predictions_test_transformer = model_transformer_gaussian.predict(inputs_test)
+predictions_test_gru = runner.predict("trained_models/gru_gaussian", inputs_test)
+predictions_test_transformer = runner.predict("trained_models/transformer_gaussian", inputs_test)
 
 # gru independent
 mu_test_gru = 2 * np.pi * predictions_test_gru[:, :time_eval]
@@ -106,18 +106,19 @@ point_predictions_sequence_model = {'mean gru': mu_test_gru, 'mean transformer':
 loss_student = {"loss": student_loss}
 loss_cauchy = {"loss": cauchy_loss}
 
-model_transformer_student = load_model(f"trained_models/student", custom_objects=loss_student)
-model_transformer_cauchy = load_model(f"trained_models/cauchy", custom_objects=loss_cauchy)
-
 # student
-predictions_test_student = model_transformer_student.predict(inputs_test)
+predictions_test_student = runner.predict("trained_models/student", inputs_test, custom_objects=loss_student)
 mu_student = 2 * np.pi * predictions_test_student[:, :time_eval]
 scale_student = 2 * np.pi * np.array(tf.math.softplus(predictions_test_student[:, 3600:3600+time_eval]))
 v = np.array(tf.math.softplus(predictions_test_student[:, 7200:7200+time_eval]))
 
 # cauchy
-predictions_test_cauchy = model_transformer_cauchy.predict(inputs_test)
+# The model outputs the medians (columns 0:3600) and, before a softplus, the scales gamma of the Cauchy
+# distributions (columns 3600:7200, half-width at half-maximum, not a std) for each second of the hour in Hz. The
+# slices 0:time_eval and 3600:3600+time_eval are the first time_eval seconds, scaled to angular frequency.
+predictions_test_cauchy = runner.predict("trained_models/cauchy", inputs_test, custom_objects=loss_cauchy)
 cauchy_median = 2 * np.pi * predictions_test_cauchy[:, 0:time_eval]
+cauchy_scale = 2 * np.pi * np.array(tf.math.softplus(predictions_test_cauchy[:, 3600:3600+time_eval]))
 
 point_predictions_fat_tails = {'model transformer cauchy': cauchy_median,
                                'model transformer student': mu_student}
@@ -135,50 +136,20 @@ probabilistic_prediction_sequence = {'model gru gaussian': {'mu': mu_test_gru, '
 
 # -----------------------------------------------------------------------------------------------------------------------
 
-# measures for different point estimators
-
-def evaluate_predictions(predictions, true_values, error_metric='MAE'):
-    if error_metric == 'MAE':
-        return mean_absolute_error(true_values, predictions)
-    elif error_metric == 'MSE':
-        return mean_squared_error(true_values, predictions)
-    elif error_metric == 'RMSE':
-        return mean_squared_error(true_values, predictions, squared=False)
-    else:
-        raise ValueError("Unknown Measure")
+# measures for different point estimators: all metrics, per-horizon-step curves, hour-of-day breakdowns and
+# bootstrap confidence intervals in one pass per model (tidy results frame). The RMSE is the mean of the RMSEs of
+# the horizon steps as with sklearn's mean_squared_error(..., squared=False) before
+hours_of_day = day_ahead_features_test.index.hour
+targets_baseline = {key: outputs_test_angular_frequency if key == 'k nearst neighbor' else y_true
+                    for key in point_predictions_baseline}
 
-
-error_metrics = ['MAE', 'MSE', 'RMSE']  # Liste der Fehlermaße, die du auswerten möchtest
-
-results_point_predictions = {}
-
-for error_metric in error_metrics:
-    results_point_predictions[error_metric] = {'baselines': {}, 'sequence_model': {},  'fat_tails': {}}
-
-    for key in point_predictions_baseline:
-        if key == 'k nearst neighbor':
-            results_point_predictions[error_metric]['baselines'][key] = evaluate_predictions(
-                point_predictions_baseline[key][:, 0:time_eval],
-                outputs_test_angular_frequency[:, 0:time_eval],
-                error_metric)
-        else:
-            print()
-            results_point_predictions[error_metric]['baselines'][key] = evaluate_predictions(
-                point_predictions_baseline[key][:, 0:time_eval],
-                y_true[:, 0:time_eval],
-                error_metric)
-
-    for key in point_predictions_sequence_model:
-        results_point_predictions[error_metric]['sequence_model'][key] = evaluate_predictions(
-            point_predictions_sequence_model[key][:, 0:time_eval],
-            outputs_test_angular_frequency[:, 0:time_eval],
-            error_metric)
-
-    for key in point_predictions_fat_tails:
-        results_point_predictions[error_metric]['fat_tails'][key] = evaluate_predictions(
-            point_predictions_fat_tails[key][:, 0:time_eval],
-            outputs_test_angular_frequency[:, 0:time_eval],
-            error_metric)
+results_point_predictions = pd.concat([
+    evaluate_point_predictions(point_predictions_baseline, targets_baseline, time_eval,
+                               hours_of_day).assign(category='baselines'),
+    evaluate_point_predictions(point_predictions_sequence_model, outputs_test_angular_frequency, time_eval,
+                               hours_of_day).assign(category='sequence_model'),
+    evaluate_point_predictions(point_predictions_fat_tails, outputs_test_angular_frequency, time_eval,
+                               hours_of_day).assign(category='fat_tails')], ignore_index=True)
 
 
 
@@ -212,6 +183,29 @@ for category, models in results_psr.items():
         })
 results_df = pd.DataFrame(results_list_psr)
 
+# closed-form proper scores of the Gaussian and fat-tailed sequence models. The CRPS is only reported for models
+# with finite means (NaN otherwise): it is infinite for the Cauchy distribution and for Student-t distributions
+# with v <= 1, so that the mean CRPS of the Cauchy model and of a Student-t model with any v <= 1 is infinite.
+# The log and interval scores are finite for all models.
+probabilistic_prediction_all = {
+    'model gru gaussian': {'family': 'normal', 'loc': mu_test_gru, 'scale': np.array(sigma_test_gru), 'df': None},
+    'model transformer gaussian': {'family': 'normal', 'loc': mu_test_transformer,
+                                   'scale': np.array(sigma_test_transformer), 'df': None},
+    'model transformer student': {'family': 'student', 'loc': mu_student, 'scale': scale_student, 'df': v},
+    'model transformer cauchy': {'family': 'cauchy', 'loc': cauchy_median, 'scale': cauchy_scale, 'df': None}}
+
+results_list_closed_form = []
+for model_name, params in probabilistic_prediction_all.items():
+    args = (outputs_test_angular_frequency[:, 0:time_eval], params['loc'], params['scale'])
+    finite_mean = params['family'] == 'normal' or (params['family'] == 'student' and np.all(params['df'] > 1))
+    results_list_closed_form.append({
+        'Model': model_name,
+        'log_score': np.median(log_score(*args, family=params['family'], df=params['df'])),
+        'crps': np.mean(crps(*args, family=params['family'], df=params['df'])) if finite_mean else np.nan,
+        'interval_score_90': np.mean(interval_score(*args, alpha=0.1, family=params['family'], df=params['df']))
+    })
+results_closed_form_df = pd.DataFrame(results_list_closed_form)
+
 # -----------------------------------------------------------------------------------------
 # prediction sample
 # Plot [] in paper
@@ -235,11 +229,12 @@ for i in range(len(prediction_sample_time)):
     feature_input.append(inputs_test[position, :].reshape(1, 14))
     true_output.append(2 * np.pi * outputs_test[position, :].reshape(len_outputs, 1))
 
-    prediction_gru_gaussian.append(model_gru_gaussian.predict(feature_input[i]))
+    # the samples are served from the (cached) outputs of the whole test set
+    prediction_gru_gaussian.append(np.asarray(predictions_test_gru[position:position + 1]))
     mu_gru_gaussian.append(2 * np.pi * prediction_gru_gaussian[i][0, :3600])
     sigma_gru_gaussian.append(2 * np.pi * tf.math.softplus(prediction_gru_gaussian[i][0, 3600:]))
 
-    prediction_transformer_gaussian.append(model_transformer_gaussian.predict(feature_input[i]))
+    prediction_transformer_gaussian.append(np.asarray(predictions_test_transformer[position:position + 1]))
     mu_transformer_gaussian.append(2 * np.pi * prediction_transformer_gaussian[i][0, :3600])
     sigma_transformer_gaussian.append(2 * np.pi * tf.math.softplus(prediction_transformer_gaussian[i][0, 3600:]))
 
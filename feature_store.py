@@ -0,0 +1,160 @@
+"""
+Columnar store of the 15min techno-economic features of a country with precomputed derived columns
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from calendar_features import index_calendar_features
+
+FILE = 'features.parquet'
+
+# Calendar features that are precomputed for each store
+DERIVED_CALENDAR_COLUMNS = ['hour_sin', 'hour_cos', 'efa_block']
+
+
+class FeatureStore:
+    """
+    Features of one country in a single parquet file (FILE in the folder of the country). The rows are sorted
+    by time and stored in row groups of about one month, so that reading a time range only decodes the row
+    groups that overlap it (predicate pushdown on the row group statistics) and reading a subset of the columns
+    only decodes these columns (projection). Derived columns (ramps and calendar features) are computed once
+    when the store is built. Named row sets (e.g. the rows of each source file) are stored as boolean columns
+    row_{name}, so that reads can select them with the same pushdown.
+
+    pyarrow is an optional dependency that is only imported when a store is built or opened.
+
+    Args:
+        path (str): Folder of the store.
+    """
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.file = os.path.join(path, FILE)
+        schema = pq.read_schema(self.file)
+        meta = json.loads(schema.metadata[b'feature_store'])
+        self.base_columns = meta['base_columns']
+        self.derived_columns = meta['derived_columns']
+        self.row_sets = meta.get('row_sets', [])
+        self.tz = meta['tz']
+        self.index_tz = schema.field('time').type.tz
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, FILE))
+
+    @classmethod
+    def open(cls, path):
+        return cls(path)
+
+    @classmethod
+    def build(cls, path, features, ramps=(), ramp_periods=4, tz=None, row_group_size=96*31, row_sets=None):
+        """
+        Write features to a new store.
+
+        Args:
+            path (str): Folder of the store.
+            features (pandas.DataFrame): Features with (naive or tz-aware) time index.
+            ramps (list, optional): Columns whose ramps (differences over ramp_periods rows) are stored as
+            {column}_ramp.
+            ramp_periods (int, optional): Number of rows of the ramps, e.g. 4 for hourly ramps of 15min data.
+            tz (str, optional): Time zone of a naive index for the calendar features (see index_calendar_features).
+            row_group_size (int, optional): Number of rows per row group (default: about one month of 15min data).
+            row_sets (dict, optional): Boolean masks of the rows of features that form named row sets (see read).
+
+        Returns:
+            FeatureStore: store of the features
+        """
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        row_sets = {} if row_sets is None else row_sets
+        base_columns = list(features.columns)
+        features = features.assign(**{'row_' + name: np.asarray(mask, dtype=bool) for name, mask in row_sets.items()})
+        features = features[~features.index.duplicated(keep='first')].sort_index()
+
+        derived = {column + '_ramp': features[column].diff(ramp_periods) for column in ramps}
+        calendar = index_calendar_features(features.index, tz, DERIVED_CALENDAR_COLUMNS)
+        derived.update({column: calendar[column].values for column in DERIVED_CALENDAR_COLUMNS})
+        derived = {column: values for column, values in derived.items() if column not in base_columns}
+        features = features.assign(**derived)
+
+        table = pa.Table.from_pandas(features.rename_axis('time').reset_index(), preserve_index=False)
+        meta = {'base_columns': base_columns, 'derived_columns': list(derived), 'row_sets': list(row_sets), 'tz': tz}
+        table = table.replace_schema_metadata({**table.schema.metadata, b'feature_store': json.dumps(meta)})
+
+        os.makedirs(path, exist_ok=True)
+        pq.write_table(table, os.path.join(path, FILE + '.tmp'), row_group_size=row_group_size)
+        os.replace(os.path.join(path, FILE + '.tmp'), os.path.join(path, FILE))
+
+        return cls.open(path)
+
+    @classmethod
+    def from_hdf(cls, path, feature_folder, **kwargs):
+        """ Build the store from input_actual.h5 and input_forecast.h5 in feature_folder. The store contains the
+        rows of both files, and the rows of each file are the row sets 'actual' and 'forecast', e.g. the rows of
+        the join in load_data are read with rows='actual'. kwargs are passed to build (the ramps are differences
+        over the rows of both files)."""
+
+        actual = pd.read_hdf(feature_folder+'input_actual.h5')
+        forecast = pd.read_hdf(feature_folder+'input_forecast.h5')
+        features = actual.join(forecast, how='outer')
+        row_sets = {'actual': features.index.isin(actual.index), 'forecast': features.index.isin(forecast.index)}
+
+        return cls.build(path, features, row_sets=row_sets, **kwargs)
+
+    @property
+    def columns(self):
+        return self.base_columns + self.derived_columns
+
+    def read(self, columns=None, start=None, end=None, rows=None):
+        """
+        Read the features of the time range [start, end] (inclusive bounds as with .loc).
+
+        Args:
+            columns (list, optional): Columns to read (default: all columns).
+            start (str, optional): First timestamp. Naive timestamps are only accepted for a store with naive
+            index (see _timestamp).
+            end (str, optional): Last timestamp.
+            rows (str, optional): Name of a row set to read (see build), all rows by default.
+
+        Returns:
+            pandas.DataFrame: features with time index
+        """
+
+        import pyarrow.parquet as pq
+
+        columns = self.columns if columns is None else list(columns)
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise ValueError('Unknown feature columns {}!'.format(sorted(unknown)))
+
+        if rows is not None and rows not in self.row_sets:
+            raise ValueError('Unknown row set {} (row sets of the store: {})!'.format(rows, self.row_sets))
+
+        filters = [('time', op, self._timestamp(time)) for op, time in (('>=', start), ('<=', end))
+                   if time is not None]
+        if rows is not None:
+            filters.append(('row_' + rows, '==', True))
+        table = pq.read_table(self.file, columns=['time'] + columns, filters=filters or None)
+
+        return table.to_pandas().set_index('time').rename_axis(None)
+
+    def _timestamp(self, time):
+        """ Timestamp that is comparable to the time column. A tz-aware time is converted to the local time of
+        a naive index (time zone tz of the store, UTC for tz=None). Naive times are ambiguous for a tz-aware index
+        and raise a ValueError."""
+
+        time = pd.Timestamp(time)
+        if self.index_tz is None:
+            return time.tz_convert(self.tz or 'UTC').tz_localize(None) if time.tz is not None else time
+        if time.tz is None:
+            raise ValueError('The timestamp {} is naive, but the index of the store has the time zone {}!'
+                             .format(time, self.index_tz))
+        return time
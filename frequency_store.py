@@ -0,0 +1,197 @@
+"""
+Memory-mapped store for frequency time series on a regular time grid
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from helper_functions import grid_start
+
+
+class FrequencyStore:
+    """
+    Frequency time series on a complete, regular time grid. The values are kept in one contiguous (usually
+    memory-mapped) array and the time index is only given by the grid metadata (start, step, tz). Hence, time
+    slicing is O(1) and intervals of the series are zero-copy views. Several processes that open the same store
+    share the pages of the memory-mapped file.
+
+    Args:
+        values (numpy.ndarray): 1-d array of values (e.g. numpy.memmap).
+        start (pandas.Timestamp): First timestamp of the grid. Naive timestamps are localized in tz.
+        step (int, optional): Time step of the grid in seconds.
+        tz (str, optional): Time zone of the grid.
+        tso_name (str, optional): Name of the TSO.
+        center (float, optional): Values are returned as (values - center) * scale.
+        scale (float, optional): Values are returned as (values - center) * scale.
+    """
+
+    def __init__(self, values, start, step=1, tz='UTC', tso_name=None, center=0., scale=1.):
+        start = pd.Timestamp(start)
+        self.values = values
+        self.start = start.tz_localize(tz) if start.tz is None else start.tz_convert(tz)
+        self.step = step
+        self.tz = tz
+        self.tso_name = tso_name
+        self.center = center
+        self.scale = scale
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        """
+        Open a store that was created with FrequencyStore.build. The values are memory-mapped.
+
+        Args:
+            path (str): Folder of the store.
+            mode (str, optional): Mode of numpy.memmap ('r', 'r+' or 'c').
+
+        Returns:
+            FrequencyStore: store with memory-mapped values.
+        """
+
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        values = np.memmap(os.path.join(path, 'values.bin'), dtype=meta['dtype'], mode=mode, shape=(meta['length'],))
+
+        return cls(values, pd.Timestamp(meta['start'], tz='UTC'), meta['step'], meta['tz'], meta['tso_name'])
+
+    @classmethod
+    def build(cls, path, chunks, tz, tso_name=None, dtype='float64'):
+        """
+        Write consecutive chunks of a 1s time series to a new store. Gaps between the chunks are filled with NaN,
+        so that only one chunk has to be kept in memory, e.g. chunks=(read_year(...) for year in years).
+
+        Args:
+            path (str): Folder of the store.
+            chunks (iterable): pandas Series with tz-aware or naive local time index (in tz) on a 1s grid.
+            tz (str): Time zone of the grid.
+            tso_name (str, optional): Name of the TSO.
+            dtype (str, optional): 'float64' or 'float32'.
+
+        Returns:
+            FrequencyStore: store with memory-mapped values.
+        """
+
+        os.makedirs(path, exist_ok=True)
+        start, length = None, 0
+
+        with open(os.path.join(path, 'values.bin'), 'wb') as f:
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                chunk_start = grid_start(chunk.index, tz)
+                if start is None:
+                    start = chunk_start
+
+                # Fill the gap to the previous chunk with NaN
+                position = (chunk_start - start) // 10**9
+                if position < length:
+                    raise ValueError('The chunks have to be ordered and must not overlap!')
+                for i in range(length, position, 86400):
+                    np.full(min(86400, position - i), np.nan, dtype=dtype).tofile(f)
+
+                chunk.values.astype(dtype).tofile(f)
+                length = position + len(chunk)
+
+        if start is None:
+            raise ValueError('There is no data to store!')
+
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'start': int(start), 'length': int(length), 'step': 1, 'tz': tz, 'tso_name': tso_name,
+                       'dtype': np.dtype(dtype).name}, f, indent=1)
+
+        return cls.open(path)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def end(self):
+        return self.start + pd.Timedelta(seconds=self.step * (len(self) - 1))
+
+    @property
+    def index(self):
+        """ Full tz-aware time index (materialized on request)."""
+        return pd.date_range(start=self.start, periods=len(self), freq='{}s'.format(self.step))
+
+    def normalized(self, center, scale):
+        """ Return a store that shares the values, but returns them as (values - center) * scale."""
+        return FrequencyStore(self.values, self.start, self.step, self.tz, self.tso_name, center, scale)
+
+    def position(self, time):
+        """ Grid position of time (O(1)). Naive timestamps are interpreted in the time zone of the store."""
+
+        time = pd.Timestamp(time)
+        time = time.tz_localize(self.tz) if time.tz is None else time
+
+        return (time.value - self.start.value) // (self.step * 10**9)
+
+    def islice(self, i, j):
+        """ Return a store with the zero-copy view of the grid positions i:j."""
+
+        i, j, _ = slice(i, j).indices(len(self))
+        start = self.start + pd.Timedelta(seconds=self.step * i)
+
+        return FrequencyStore(self.values[i:j], start, self.step, self.tz, self.tso_name, self.center, self.scale)
+
+    def slice(self, start=None, end=None):
+        """ Return a store with the zero-copy view of the time interval [start, end] (as label-based .loc)."""
+
+        i = 0 if start is None else max(self.position(start), 0)
+        j = len(self) if end is None else max(self.position(end) + 1, 0)
+
+        return self.islice(i, j)
+
+    def raw_windows(self, length=3600, offset=0):
+        """ Zero-copy 2-d view of the consecutive windows of length grid points starting at position offset
+        (untransformed values)."""
+
+        n_windows = (len(self) - offset) // length
+
+        return self.values[offset:offset + n_windows * length].reshape(n_windows, length)
+
+    def windows(self, length=3600, offset=0):
+        """ Consecutive windows of length grid points starting at position offset. This is a zero-copy view if
+        the store is not normalized."""
+
+        return self._transform(self.raw_windows(length, offset))
+
+    def hourly_windows(self, offset=0):
+        """ Hourly windows starting at position offset (zero-copy view if the store is not normalized)."""
+        return self.windows(3600 // self.step, offset)
+
+    def window_index(self, length=3600, offset=0):
+        """ Start times of the windows in windows(length, offset)."""
+
+        n_windows = (len(self) - offset) // length
+
+        return pd.date_range(start=self.start + pd.Timedelta(seconds=self.step * offset), periods=n_windows,
+                             freq='{}s'.format(self.step * length))
+
+    def nan_mask(self):
+        """ Boolean mask of missing values."""
+        return np.isnan(self.values)
+
+    def window_nan_counts(self, length=3600, offset=0, chunk_size=24*365):
+        """ Number of missing values in each window of windows(length, offset), computed in chunks of windows."""
+
+        windows = self.raw_windows(length, offset)
+
+        return np.concatenate([np.isnan(windows[i:i + chunk_size]).sum(axis=1)
+                               for i in range(0, max(len(windows), 1), chunk_size)])
+
+    def to_series(self, tz_aware=False):
+        """ Materialize the store as pandas Series with naive local (or tz-aware) time index."""
+
+        index = self.index
+
+        return pd.Series(self._transform(np.asarray(self.values)), index=index if tz_aware else index.tz_localize(None))
+
+    def _transform(self, values):
+        if self.center == 0 and self.scale == 1:
+            return values
+        return (values - self.center) * self.scale
+
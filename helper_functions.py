@@ -1,4 +1,11 @@
 import glob
+import io
+import json
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
 from calendar import monthrange
 import numpy as np
 import pandas as pd
@@ -17,7 +24,119 @@ def true_intervals(bool_arr):
     return interval_bounds, interval_sizes
 
 
-def extreme_points(data, limit=(49, 51)):
+class IntervalSet:
+
+    """ Set of positions stored as sorted, disjoint and non-adjacent intervals [start, end), i.e. as the interval 
+    bounds of true_intervals. Marking and counting corrupted data costs O(number of intervals) instead of 
+    O(number of samples)."""
+
+    def __init__(self, bounds=()):
+        self.bounds = np.asarray(bounds, dtype=np.intp).reshape(-1, 2)
+
+    @classmethod
+    def from_mask(cls, bool_arr):
+        return cls(true_intervals(np.asarray(bool_arr))[0])
+
+    @classmethod
+    def from_indices(cls, indices):
+        indices = np.unique(np.asarray(indices, dtype=np.intp))
+        breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+        starts = indices[np.concatenate([[0], breaks])] if indices.size else indices
+        ends = indices[np.concatenate([breaks - 1, [indices.size - 1]])] + 1 if indices.size else indices
+
+        return cls(np.stack([starts, ends], axis=1))
+
+    @property
+    def sizes(self):
+        return self.bounds[:, 1] - self.bounds[:, 0]
+
+    def __len__(self):
+        return self.bounds.shape[0]
+
+    def __iter__(self):
+        return iter(map(tuple, self.bounds))
+
+    def __repr__(self):
+        return 'IntervalSet({} intervals, {} positions)'.format(len(self), self.count())
+
+    def count(self):
+        """ Number of positions in the set."""
+        return int(self.sizes.sum())
+
+    def longer_than(self, limit):
+        """ Intervals with more than limit positions."""
+        return IntervalSet(self.bounds[self.sizes > limit])
+
+    def shorter_than(self, limit):
+        """ Intervals with less than limit positions."""
+        return IntervalSet(self.bounds[self.sizes < limit])
+
+    def union(self, *others):
+        return combine_intervals((self,) + others, min_cover=1)
+
+    def intersection(self, *others):
+        return combine_intervals((self,) + others, min_cover=len(others) + 1)
+
+    def to_indices(self):
+        """ Explicit positions of the set (the same as np.hstack([np.r_[i:j] for i, j in bounds]))."""
+        sizes = self.sizes
+        shifts = self.bounds[:, 0] - np.cumsum(np.concatenate([[0], sizes[:-1]]))
+        return np.repeat(shifts, sizes) + np.arange(sizes.sum())
+
+    def to_mask(self, n):
+        mask = np.zeros(n, dtype=bool)
+        self.apply(mask, True, inplace=True)
+        return mask
+
+    def apply(self, data, fill=np.nan, inplace=False):
+        
+        """ Set the positions of the set in data (numpy array or pandas Series) to fill. Returns a copy of data
+        unless inplace=True, which is only supported for numpy arrays."""
+
+        if inplace and not isinstance(data, np.ndarray):
+            raise TypeError('inplace=True requires a numpy array!')
+        values = data if inplace else np.array(data, dtype=np.result_type(np.asarray(data).dtype, type(fill)))
+
+        # Single points are set at once, longer intervals as slices
+        single = self.sizes == 1
+        values[self.bounds[single, 0]] = fill
+        for i, j in self.bounds[~single]:
+            values[i:j] = fill
+
+        if isinstance(data, pd.Series) and not inplace:
+            return pd.Series(values, index=data.index, name=data.name)
+        return values
+
+
+def combine_intervals(sets, min_cover):
+
+    """ Positions that are covered by at least min_cover of the interval sets (union for 1, intersection for 
+    len(sets)). The intervals are combined by sweeping over their sorted bounds."""
+
+    starts = np.concatenate([s.bounds[:, 0] for s in sets])
+    ends = np.concatenate([s.bounds[:, 1] for s in sets])
+    positions = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(starts.size, dtype=np.intp), -np.ones(ends.size, dtype=np.intp)])
+
+    # Starts before ends at the same position, so that adjacent intervals are merged
+    order = np.lexsort((-deltas, positions))
+    positions, cover = positions[order], np.cumsum(deltas[order])
+
+    # Position k of the sweep is covered on [positions[k], positions[k+1])
+    event_bounds, _ = true_intervals(cover >= min_cover)
+    bounds = np.stack([positions[event_bounds[:, 0]], positions[event_bounds[:, 1]]], axis=1)
+
+    return IntervalSet(bounds[bounds[:, 1] > bounds[:, 0]])
+
+
+def extreme_points(data, limit=(49, 51), as_intervals=False):
+    if as_intervals:
+        f_too_low = IntervalSet.from_mask((data < limit[0]).values)
+        f_too_high = IntervalSet.from_mask((data > limit[1]).values)
+        print('Number of too high frequency values: ', f_too_high.count(),
+              'Number of too low frequency values: ', f_too_low.count())
+        return f_too_low, f_too_high
+
     f_too_low = np.argwhere((data < limit[0]).values)[:, 0]
     f_too_high = np.argwhere((data > limit[1]).values)[:, 0]
 
@@ -27,7 +146,12 @@ def extreme_points(data, limit=(49, 51)):
     return f_too_low, f_too_high
 
 
-def extreme_inc(increments, limit=0.05):
+def extreme_inc(increments, limit=0.05, as_intervals=False):
+    if as_intervals:
+        inc_too_high = IntervalSet.from_mask((increments.abs() > limit).values)
+        print('Number of too large increments: ', inc_too_high.count())
+        return inc_too_high
+
     inc_too_high = np.argwhere((increments.abs() > limit).values)[:, 0]
 
     print('Number of too large increments: ', inc_too_high.size)
@@ -35,9 +159,15 @@ def extreme_inc(increments, limit=0.05):
     return inc_too_high
 
 
-def const_windows(increments, limit=60):
+def const_windows(increments, limit=60, as_intervals=False):
     wind_bounds, wind_sizes = true_intervals(increments.abs() < 1e-9)
 
+    if as_intervals:
+        windows = IntervalSet(wind_bounds)
+        long_windows = windows.longer_than(limit)
+        print('Number of windows with constant frequency for longer than {}s: '.format(limit), len(long_windows))
+        return windows, long_windows
+
     long_windows = [[]]
     long_window_bounds = wind_bounds[wind_sizes > limit]
 
@@ -50,23 +180,209 @@ def const_windows(increments, limit=60):
     return wind_bounds, wind_sizes, long_windows, long_window_bounds
 
 
-def nan_windows(data):
+def nan_windows(data, as_intervals=False):
     wind_bounds, wind_sizes= true_intervals(data.isnull())
 
     print('Number of Nan-intervals: ', wind_sizes.shape[0])
 
+    if as_intervals:
+        return IntervalSet(wind_bounds)
+
     return wind_bounds, wind_sizes
 
 
-def isolated_peaks(increments, limit=0.05):
+def isolated_peaks(increments, limit=0.05, as_intervals=False):
     high_incs = increments.where(increments.abs() > limit)
     peak_locations = np.argwhere((high_incs * high_incs.shift(-1) < 0).values)[:, 0]
 
     print('Number of isolated peaks: ', peak_locations.size)
 
+    if as_intervals:
+        return IntervalSet.from_indices(peak_locations)
+
     return peak_locations
 
 
+class RunTracker:
+
+    """ Collect the (start, end) bounds of intervals where a boolean array is true, if the array is passed in
+    consecutive chunks. Runs that are still open at the end of a chunk are carried over to the next one."""
+
+    def __init__(self):
+        self.open_start = None
+        self.bounds = []
+
+    def update(self, mask, offset):
+        padded = np.concatenate([[self.open_start is not None], mask, [False]])
+        edges = np.flatnonzero(padded[1:] != padded[:-1]) + offset
+        if self.open_start is not None:
+            edges = np.concatenate([[self.open_start], edges])
+        bounds = edges.reshape(-1, 2)
+
+        # A run that reaches the end of the chunk stays open
+        self.open_start = None
+        if bounds.shape[0] > 0 and bounds[-1, 1] == offset + mask.size:
+            self.open_start = bounds[-1, 0]
+            bounds = bounds[:-1]
+        self.bounds.append(bounds)
+
+    def finish(self, n):
+        if self.open_start is not None:
+            self.bounds.append(np.array([[self.open_start, n]]))
+            self.open_start = None
+
+        interval_bounds = np.concatenate(self.bounds).astype(np.intp) if self.bounds else np.empty((0, 2), np.intp)
+
+        return interval_bounds, interval_bounds[:, 1] - interval_bounds[:, 0]
+
+
+def find_corrupted_data(data, limit=(49, 51), T_c=60, df_c=0.05, chunk_size=2**22, as_intervals=False):
+
+    """ Find extreme points, isolated peaks, constant windows and NaN-windows in one chunked pass over the data. 
+    Only a few temporaries of chunk_size are allocated. Return a dict with the results of extreme_points, 
+    isolated_peaks, const_windows and nan_windows (applied to data and data.diff()). For as_intervals=True, the 
+    dict contains the interval sets 'f_too_low', 'f_too_high', 'peak_loc', 'windows', 'long_windows' and 
+    'missing_data'."""
+
+    values = np.asarray(data, dtype=np.float64)
+    n = values.size
+
+    f_too_low, f_too_high, peak_loc = [], [], []
+    const_runs, nan_runs = RunTracker(), RunTracker()
+    last_value, last_inc = np.nan, np.nan
+
+    for offset in range(0, n, chunk_size):
+        chunk = values[offset:offset + chunk_size]
+
+        # Increments (the first increment of the series is NaN)
+        inc = np.empty_like(chunk)
+        inc[0] = chunk[0] - last_value
+        np.subtract(chunk[1:], chunk[:-1], out=inc[1:])
+
+        f_too_low.append(np.flatnonzero(chunk < limit[0]) + offset)
+        f_too_high.append(np.flatnonzero(chunk > limit[1]) + offset)
+        nan_runs.update(np.isnan(chunk), offset)
+
+        abs_inc = np.abs(inc)
+        const_runs.update(abs_inc < 1e-9, offset)
+
+        # Isolated peaks: large increments followed by a large increment with opposite sign. The pair 
+        # (last increment of previous chunk, first increment of this chunk) is evaluated here.
+        high_inc = np.where(abs_inc > df_c, inc, np.nan)
+        pairs = np.concatenate([[last_inc], high_inc])
+        peak_loc.append(np.flatnonzero(pairs[:-1] * pairs[1:] < 0) + offset - 1)
+
+        last_value, last_inc = chunk[-1], high_inc[-1]
+
+    f_too_low = np.concatenate(f_too_low) if f_too_low else np.array([], dtype=np.intp)
+    f_too_high = np.concatenate(f_too_high) if f_too_high else np.array([], dtype=np.intp)
+    peak_loc = np.concatenate(peak_loc) if peak_loc else np.array([], dtype=np.intp)
+    window_bounds, window_sizes = const_runs.finish(n)
+    missing_data_bounds, missing_data_sizes = nan_runs.finish(n)
+
+    long_window_bounds = window_bounds[window_sizes > T_c]
+
+    print('Number of too high frequency values: ', f_too_high.size,
+          'Number of too low frequency values: ', f_too_low.size)
+    print('Number of isolated peaks: ', peak_loc.size)
+    print('Number of windows with constant frequency for longer than {}s: '.format(T_c),
+          long_window_bounds.shape[0])
+    print('Number of Nan-intervals: ', missing_data_sizes.shape[0])
+
+    if as_intervals:
+        return {'f_too_low': IntervalSet.from_indices(f_too_low), 'f_too_high': IntervalSet.from_indices(f_too_high),
+                'peak_loc': IntervalSet.from_indices(peak_loc), 'windows': IntervalSet(window_bounds),
+                'long_windows': IntervalSet(long_window_bounds), 'missing_data': IntervalSet(missing_data_bounds)}
+
+    long_windows = [[]]
+    if long_window_bounds.size != 0:
+        long_windows = np.hstack([np.r_[i:j] for i, j in long_window_bounds])
+
+    return {'f_too_low': f_too_low, 'f_too_high': f_too_high, 'peak_loc': peak_loc,
+            'window_bounds': window_bounds, 'window_sizes': window_sizes, 
+            'long_windows_indices': long_windows, 'long_window_bounds': long_window_bounds,
+            'missing_data_bounds': missing_data_bounds, 'missing_data_sizes': missing_data_sizes}
+
+
+def clean_chunks(chunks, N_f=6, T_c=60, df_c=0.05, limit=(49, 51), state=None):
+
+    """ Mark and clean corrupted data in a series that is given as consecutive chunks (pandas Series) and yield
+    the cleansed chunks. The result is identical to marking extreme points, isolated peaks and constant windows 
+    longer than T_c on the complete series and filling up to N_f NaN-values by propagating the last valid value. 
+    Samples whose marking depends on the next chunk (the last sample and a trailing constant window of at most 
+    T_c points) are carried over, so that the memory is bounded by the chunk size.
+
+    If a dict is passed as state, the cleansing continues from its content and the state before cleansing the
+    last carried samples is stored in it at the end. Hence, a later call with the same dict and the following 
+    chunks replaces the last len(state['held']) cleansed values and continues the series seamlessly."""
+
+    state = {} if state is None else state
+    held = state.get('held')                      # Raw samples that are not cleansed yet
+    prev_value = state.get('prev_value', np.nan)  # Last raw value before the held samples (for the increments)
+    run_len = state.get('run_len', 0)             # Length of a long constant window that continues into held
+    last_valid = state.get('last_valid', np.nan)  # Last valid cleansed value (for the forward fill)
+    gap = state.get('gap', 0)                     # Number of NaN-values since last_valid
+
+    def process(buffer, final):
+        nonlocal prev_value, run_len, last_valid, gap
+
+        x = buffer.values.astype(np.float64)
+        n = x.size
+        inc = np.diff(x, prepend=prev_value)
+
+        # Constant windows (in the increments). A window at the start continues a carried long window.
+        bounds, sizes = true_intervals(np.abs(inc) < 1e-9)
+        if run_len > 0 and bounds.shape[0] > 0 and bounds[0, 0] == 0:
+            sizes[0] += run_len
+
+        # Hold back the last sample (peak detection needs the next increment) and a trailing constant window
+        # that may still become longer than T_c
+        hold_from = n if final else n - 1
+        if not final and bounds.shape[0] > 0 and bounds[-1, 1] == n and sizes[-1] <= T_c:
+            hold_from = min(hold_from, bounds[-1, 0])
+
+        # Mark corrupted data
+        mark = np.zeros(n, dtype=bool)
+        mark |= (x < limit[0]) | (x > limit[1])
+        high_inc = np.where(np.abs(inc) > df_c, inc, np.nan)
+        mark[:-1] |= high_inc[:-1] * high_inc[1:] < 0
+        long_bounds = bounds[sizes > T_c]
+        edges = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(edges, long_bounds[:, 0], 1)
+        np.add.at(edges, long_bounds[:, 1], -1)
+        mark |= np.cumsum(edges[:-1]) > 0
+        
+        x_m = np.where(mark, np.nan, x)[:hold_from]
+
+        # Fill up to N_f NaN-values with the last valid value (also from previous chunks)
+        positions = np.arange(hold_from)
+        last_pos = np.maximum.accumulate(np.where(np.isnan(x_m), -1, positions)) if hold_from else positions
+        fill_values = np.where(last_pos >= 0, x_m[np.maximum(last_pos, 0)], last_valid)
+        gaps = np.where(last_pos >= 0, positions - last_pos, positions + 1 + gap)
+        x_cl = np.where(np.isnan(x_m) & (gaps <= N_f), fill_values, x_m)
+
+        # Carry the state to the next chunk
+        if hold_from > 0:
+            last_valid, gap = fill_values[-1] if np.isnan(x_m[-1]) else x_m[-1], gaps[-1] if np.isnan(x_m[-1]) else 0
+            prev_value = x[hold_from - 1]
+            
+            in_run = bounds.shape[0] > 0 and bounds[-1, 0] < hold_from <= bounds[-1, 1]
+            run_len = (hold_from - bounds[-1, 0] + (run_len if bounds[-1, 0] == 0 else 0)) if in_run else 0
+
+        return pd.Series(x_cl, index=buffer.index[:hold_from]), buffer.iloc[hold_from:]
+
+    for chunk in chunks:
+        held = chunk if held is None or held.empty else pd.concat([held, chunk])
+        cleansed, held = process(held, final=False)
+        if not cleansed.empty:
+            yield cleansed
+
+    state.update(held=held, prev_value=prev_value, run_len=run_len, last_valid=last_valid, gap=gap)
+
+    if held is not None and not held.empty:
+        yield process(held, final=True)[0]
+
+
 def prepare_files(in_path, name_pattern):
     
     """Prepare a list of files in in_path that is sorted according to the date in the filename. Moreover,
@@ -90,173 +406,916 @@ def prepare_files(in_path, name_pattern):
 
     return files, start_time, end_time
 
+# Time zones of the TSO recordings. They define the regular 1s grid behind the naive local time index.
+TIMEZONES = {'TransnetBW': 'CET', 'Nationalgrid': 'GB', 'Fingrid': 'Europe/Helsinki'}
+
+
+def year_folder(root_folder, year, suffix, tso_name):
+    return root_folder + '{}'.format(year) + suffix + '/{}/'.format(tso_name)
+
+
 def create_year_folders(root_folder, data, suffix, tso_name):
     
     for year in data.index.year.unique():
-        folder = root_folder + '{}'.format(year) + suffix + '/{}/'.format(tso_name)
+        folder = year_folder(root_folder, year, suffix, tso_name)
     
         if not os.path.exists(folder):
             os.makedirs(folder)   
+
+
+def month_slices(index):
+
+    """ Split a sorted time index into slices of consecutive (local) months. Return list of (year, month, slice)."""
+
+    keys = index.year * 100 + index.month
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1, [len(index)]])
+
+    return [(keys[i] // 100, keys[i] % 100, slice(i, j)) for i, j in zip(bounds[:-1], bounds[1:])]
+
+
+def to_yearly_csv(data, float_format):
+
+    """ Format data (pandas Series with local time index) as csv text with naive local time for each of its
+    years."""
+
+    if data.index.tz is not None:
+        data = data.tz_localize(None)
+
+    years = data.index.year
+
+    # Months usually lie within one year, so that we can avoid splitting the data
+    if years[0] == years[-1]:
+        return [(years[0], data.to_csv(None, float_format=float_format, na_rep='NaN', header=False))]
+
+    return [(year, data[years == year].to_csv(None, float_format=float_format, na_rep='NaN', header=False))
+            for year in pd.unique(years)]
+
+
+def to_dtype(data, dtype):
+    return data.astype(dtype)
+
+
+def encode_all(data, encoders):
+    return [encode(data) for encode in encoders]
+
+
+class YearlyZipWriter:
+
+    """ Stream consecutive chunks of a time series into one zipped csv file per year. The chunks have to be
+    ordered in time. The written files are identical to the ones obtained from writing the full series with
+    groupby(year) and to_csv, but only one chunk has to be kept in memory. For append=True, the chunks are
+    appended to existing files of their years."""
+
+    def __init__(self, root_folder, suffix, tso_name, float_format, append=False):
+        self.root_folder = root_folder
+        self.suffix = suffix
+        self.tso_name = tso_name
+        self.float_format = float_format
+        self.append = append
+        self.year = None
+        self._archive = None
+        self._stream = None
+        self._file = None
+
+        # Picklable function that prepares chunks for write_encoded, e.g. in worker processes
+        self.encoder = partial(to_yearly_csv, float_format=float_format)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk):
+
+        """ Append chunk (pandas Series with local time index) to the files of its years."""
+
+        if not chunk.empty:
+            self.write_encoded(self.encoder(chunk))
+
+    def write_encoded(self, yearly_csv):
+
+        """ Append already formatted csv text, given as list of (year, text), to the files of the years."""
+
+        for year, text in yearly_csv:
+            self._open_year(year)
+            self._stream.write(text)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._archive.close()
+            self._stream, self._archive = None, None
+            # Replace the existing file only after the archive is complete
+            if self._file.endswith('.tmp'):
+                os.replace(self._file, self._file[:-4])
+
+    def _open_year(self, year):
+        if year == self.year:
+            return
+        if self.year is not None and year < self.year:
+            raise ValueError('Chunks have to be written in chronological order!')
+        self.close()
+
+        folder = year_folder(self.root_folder, year, self.suffix, self.tso_name)
+        os.makedirs(folder, exist_ok=True)
+        file = folder + '{}.zip'.format(year)
+        existing = self.append and os.path.exists(file)
+        
+        self._file = file + '.tmp' if existing else file
+        self._archive, self._stream = open_zipped_csv(self._file, '{}.csv'.format(year))
+        self.year = year
+
+        # Zip archives can not be extended in place, so that the existing csv text is copied to the new archive
+        if existing:
+            copy_zipped_csv(file, self._stream)
+
+
+def open_zipped_csv(file, name):
+
+    """ Create a zip archive with the same settings as pandas' to_csv(compression='zip') and return the archive 
+    and a text stream to its csv file name."""
+
+    archive = zipfile.ZipFile(file, mode='w', compression=zipfile.ZIP_DEFLATED)
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+
+    return archive, io.TextIOWrapper(archive.open(zinfo, mode='w'), encoding='utf-8', newline='')
+
+
+def copy_zipped_csv(file, stream, drop_last=0, block_size=2**20):
+
+    """ Copy the csv text of a zip archive to stream without its last drop_last lines. The text is copied in 
+    blocks, so that it is never completely kept in memory. Return the number of lines that could not be dropped 
+    because the file is too short."""
+
+    with zipfile.ZipFile(file) as archive:
+        with io.TextIOWrapper(archive.open(archive.namelist()[0]), encoding='utf-8', newline='') as source:
+            tail = ''
+            for block in iter(lambda: source.read(block_size), ''):
+                tail += block
+                # Keep the last block_size characters that may contain the dropped lines
+                if len(tail) > 2 * block_size:
+                    stream.write(tail[:-block_size])
+                    tail = tail[-block_size:]
+
+    lines = tail.splitlines(keepends=True)
+    stream.write(''.join(lines[:max(len(lines) - drop_last, 0)]))
+
+    return max(drop_last - len(lines), 0)
+
+
+class YearlyBinaryWriter:
+
+    """ Stream consecutive chunks of a regular 1s time series into a columnar binary format ('npy' or 'parquet')
+    with one file per month. The time index is not stored, but the start (in UTC) and step of the regular grid
+    are written for each month to the metadata file {year}.json. Hence, the data can be read without parsing 
+    timestamps. Chunks with naive local time index are localized in tz. For append=True, the chunks are appended 
+    to the existing files of their years."""
+
+    def __init__(self, root_folder, suffix, tso_name, storage='npy', dtype='float64', tz=None, append=False):
+        if storage not in ('npy', 'parquet'):
+            raise ValueError('Unknown binary storage format {}!'.format(storage))
+
+        self.root_folder = root_folder
+        self.suffix = suffix
+        self.tso_name = tso_name
+        self.storage = storage
+        self.dtype = np.dtype(dtype)
+        self.tz = tz if tz is not None else TIMEZONES.get(tso_name)
+        self.append = append
+        self._month = None
+        self._start = None
+        self._values = []
+        self._meta = None
+
+        # Picklable function that prepares chunks for write_encoded, e.g. in worker processes
+        self.encoder = partial(to_dtype, dtype=self.dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk):
+
+        """ Append chunk (pandas Series with local time index on a regular 1s grid) to the files of its months."""
+
+        if not chunk.empty:
+            self.write_encoded(self.encoder(chunk))
+
+    def write_encoded(self, chunk):
+        for year, month, part in month_slices(chunk.index):
+            part = chunk.iloc[part]
+            start = grid_start(part.index, self.tz)
+
+            # Months are buffered until they are complete
+            if (year, month) != self._month or start != self._end():
+                self._flush()
+                self._month, self._start = (year, month), start
+                self._continue_month(year, month)
+            self._values.append(part.values.astype(self.dtype, copy=False))
+
+    def close(self):
+        self._flush()
+
+    def _end(self):
+        return self._start + sum(len(values) for values in self._values) * 10**9
+
+    def _load_meta(self, year):
+        if self._meta is not None and self._meta['year'] == int(year):
+            return
+        
+        # Start a new metadata file for each year or continue the existing one for append=True
+        file = year_folder(self.root_folder, year, self.suffix, self.tso_name) + '{}.json'.format(year)
+        if self.append and os.path.exists(file):
+            with open(file) as f:
+                self._meta = json.load(f)
+        else:
+            self._meta = {'year': int(year), 'tz': self.tz, 'step': 1, 'dtype': self.dtype.name, 'chunks': []}
+
+    def _continue_month(self, year, month):
+
+        """ Take over the last stored part of the month if the buffered values continue it, so that appended
+        data is stored in the same files as for writing the complete series at once."""
+
+        if not self.append:
+            return
+        self._load_meta(year)
+        
+        chunks = self._meta['chunks']
+        if chunks and chunks[-1]['file'].startswith('{}-{:02d}'.format(year, month)) \
+                and chunks[-1]['start'] + chunks[-1]['length'] * 10**9 == self._start:
+            last = chunks.pop()
+            folder = year_folder(self.root_folder, year, self.suffix, self.tso_name)
+            self._values.append(read_values(folder + last['file'], self.storage).astype(self.dtype, copy=False))
+            self._start = last['start']
+
+    def _flush(self):
+        if not self._values:
+            return
+
+        year, month = self._month
+        values = np.concatenate(self._values)
+        self._values = []
+
+        folder = year_folder(self.root_folder, year, self.suffix, self.tso_name)
+        os.makedirs(folder, exist_ok=True)
+        self._load_meta(year)
+
+        # Months with gaps in the time index are stored in several parts
+        name = '{}-{:02d}'.format(year, month)
+        n_parts = sum(chunk['file'].startswith(name) for chunk in self._meta['chunks'])
+        file = name + ('_{}'.format(n_parts) if n_parts else '') + '.' + self.storage
+        write_values(folder + file, values, self.storage)
+
+        self._meta['chunks'].append({'file': file, 'start': int(self._start), 'length': int(values.size)})
+        with open(folder + '{}.json'.format(year), 'w') as f:
+            json.dump(self._meta, f, indent=1)
+
+
+class MultiWriter:
+
+    """ Write the same chunks with several writers, e.g. to store zipped csv alongside a binary format."""
+
+    def __init__(self, writers):
+        self.writers = writers
+        self.encoder = partial(encode_all, encoders=[writer.encoder for writer in writers])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk):
+        for writer in self.writers:
+            writer.write(chunk)
+
+    def write_encoded(self, encoded):
+        for writer, chunk in zip(self.writers, encoded):
+            writer.write_encoded(chunk)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+def open_writer(root_folder, suffix, tso_name, storage='zip', float_format='%.6f', dtype='float64', append=False):
+
+    """ Open a writer for the yearly outputs of a TSO. storage is 'zip' (zipped csv with float_format), 'npy' or
+    'parquet' (binary with dtype) or a comma-separated list of them, e.g. 'zip,npy', to write several formats.
+    For append=True, the data is appended to the existing outputs."""
+
+    writers = []
+    for name in storage.split(','):
+        if name == 'zip':
+            writers.append(YearlyZipWriter(root_folder, suffix, tso_name, float_format, append))
+        else:
+            writers.append(YearlyBinaryWriter(root_folder, suffix, tso_name, name, dtype, append=append))
+
+    return writers[0] if len(writers) == 1 else MultiWriter(writers)
+
+
+def grid_start(index, tz):
+
+    """ Return the start of the regular 1s grid in index in nanoseconds since epoch (UTC). A naive local time
+    index is localized in tz. Raise an error if the index is not a complete grid."""
+
+    if index.tz is None:
+        aware = pd.date_range(start=index[:1].tz_localize(tz)[0], periods=len(index), freq='1s')
+        regular = np.array_equal(as_ns(aware.tz_localize(None)), as_ns(index))
+        start = aware[0].value
+    else:
+        regular = (np.diff(as_ns(index)) == 10**9).all()
+        start = index[0].value
+    
+    if not regular:
+        raise ValueError('The binary storage requires a complete time index with 1s resolution!')
+    
+    return start
+
+
+def as_ns(index):
+
+    """ Return the timestamps of a DatetimeIndex in nanoseconds since epoch (UTC for tz-aware index)."""
+
+    return index.values.astype('datetime64[ns]').view(np.int64)
+
+
+def write_values(file, values, storage):
+    if storage == 'npy':
+        np.save(file, values)
+    else:
+        # Optional dependency for the parquet format
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table({'f': values}), file)
+
+
+def read_values(file, storage, mmap=False):
+    if storage == 'npy':
+        return np.load(file, mmap_mode='r' if mmap else None)
+    import pyarrow.parquet as pq
+    return pq.read_table(file, columns=['f']).column('f').to_numpy()
+
+
+def read_year(root_folder, year, suffix, tso_name, storage='zip', tz_aware=False):
+
+    """ Read the yearly output of a TSO as pandas Series. For the binary formats, the index is reconstructed from
+    the grid metadata without parsing timestamps. The index is in naive local time as in the csv files, or 
+    tz-aware for tz_aware=True (binary formats only)."""
+
+    folder = year_folder(root_folder, year, suffix, tso_name)
+
+    if storage == 'zip':
+        data = pd.read_csv(folder + '{}.zip'.format(year), index_col=0, header=None).iloc[:, 0]
+        data.index = pd.to_datetime(data.index, format='%Y-%m-%d %H:%M:%S')
+        data.index.name, data.name = None, None
+        return data
+
+    with open(folder + '{}.json'.format(year)) as f:
+        meta = json.load(f)
+
+    step = meta['step'] * 10**9
+    values = np.concatenate([read_values(folder + chunk['file'], storage) for chunk in meta['chunks']])
+    ns = np.concatenate([chunk['start'] + step * np.arange(chunk['length'], dtype=np.int64)
+                         for chunk in meta['chunks']])
+    index = pd.DatetimeIndex(ns.view('datetime64[ns]')).tz_localize('UTC').tz_convert(meta['tz'])
+
+    return pd.Series(values, index=index if tz_aware else index.tz_localize(None))
+
+
+def available_years(root_folder, suffix, tso_name):
+    
+    """ Sorted list of the years with output folders of a TSO."""
+
+    folders = glob.glob(root_folder + '*' + suffix + '/{}/'.format(tso_name))
+
+    return sorted(int(parse(root_folder + '{year:d}' + suffix + '/{}/'.format(tso_name), folder)['year'])
+                  for folder in folders)
+
+
+def read_years(root_folder, suffix, tso_name, years=None, storage='zip', tz_aware=False):
+
+    """ Read and concatenate the yearly outputs of a TSO. By default, all available years are read."""
+
+    if years is None:
+        years = available_years(root_folder, suffix, tso_name)
+
+    return pd.concat([read_year(root_folder, year, suffix, tso_name, storage, tz_aware) for year in years])
+
+
+def iter_chunks(root_folder, suffix, tso_name, years=None, storage='zip', chunk_size=2**22, skip=0):
+
+    """ Read the yearly outputs of a TSO in consecutive chunks of at most chunk_size values, so that the complete
+    series never has to be kept in memory. The chunks have naive local time index as in read_years. The first 
+    skip values of the first year are not read."""
+
+    if years is None:
+        years = available_years(root_folder, suffix, tso_name)
+
+    for year in years:
+        folder = year_folder(root_folder, year, suffix, tso_name)
+
+        if storage == 'zip':
+            try:
+                reader = pd.read_csv(folder + '{}.zip'.format(year), index_col=0, header=None, chunksize=chunk_size,
+                                     skiprows=skip)
+            except pd.errors.EmptyDataError:
+                # All values of the year are skipped
+                reader = []
+            skip = 0
+            for chunk in reader:
+                chunk = chunk.iloc[:, 0]
+                chunk.index = pd.to_datetime(chunk.index, format='%Y-%m-%d %H:%M:%S')
+                chunk.index.name, chunk.name = None, None
+                yield chunk
+            continue
+
+        with open(folder + '{}.json'.format(year)) as f:
+            meta = json.load(f)
+
+        for month in meta['chunks']:
+            if skip >= month['length']:
+                skip -= month['length']
+                continue
+            values = read_values(folder + month['file'], storage, mmap=True)
+            index = pd.date_range(start=pd.Timestamp(month['start'], tz='UTC'), periods=month['length'],
+                                  freq='{}s'.format(meta['step'])).tz_convert(meta['tz']).tz_localize(None)
+            for i in range(skip, month['length'], chunk_size):
+                yield pd.Series(np.array(values[i:i + chunk_size]), index=index[i:i + chunk_size])
+            skip = 0
+        skip = 0
+
+
+def truncate_outputs(root_folder, suffix, tso_name, n, storage='zip'):
+
+    """ Remove the last n values from the yearly outputs of a TSO (in all formats of storage), e.g. to replace
+    values that were provisionally cleansed at the end of the previous update."""
+
+    for name in storage.split(','):
+        remaining = n
+        for year in available_years(root_folder, suffix, tso_name)[::-1]:
+            if remaining == 0:
+                break
+            folder = year_folder(root_folder, year, suffix, tso_name)
+
+            if name == 'zip':
+                file = folder + '{}.zip'.format(year)
+                archive, stream = open_zipped_csv(file + '.tmp', '{}.csv'.format(year))
+                with archive, stream:
+                    remaining = copy_zipped_csv(file, stream, drop_last=remaining)
+                os.replace(file + '.tmp', file)
+                continue
+
+            with open(folder + '{}.json'.format(year)) as f:
+                meta = json.load(f)
+
+            while remaining > 0 and meta['chunks']:
+                chunk = meta['chunks'][-1]
+                if chunk['length'] > remaining:
+                    chunk['length'] -= remaining
+                    write_values(folder + chunk['file'], read_values(folder + chunk['file'], name)[:chunk['length']],
+                                 name)
+                    remaining = 0
+                else:
+                    meta['chunks'].pop()
+                    os.remove(folder + chunk['file'])
+                    remaining -= chunk['length']
+
+            with open(folder + '{}.json'.format(year), 'w') as f:
+                json.dump(meta, f, indent=1)
+
+
+def map_files(func, args, workers=1):
+
+    """ Apply func to each tuple of arguments in args and yield futures of the results in the order of args.
+    For workers > 1, the files are processed in a pool of processes. At most workers results (including the one
+    that is yielded) are held at the same time, so that the memory usage is bounded by workers encoded files."""
+
+    if workers <= 1:
+        for arg in args:
+            future = Future()
+            try:
+                future.set_result(func(*arg))
+            except Exception as e:
+                future.set_exception(e)
+            yield future
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for arg in args:
+            pending.append(executor.submit(func, *arg))
+            if len(pending) >= workers:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+
+def convert_file(read_file, encode, *args):
+
+    """ Read one file with read_file(*args) and prepare it for storage with encode (the encoder of the writer, e.g.
+    formatting as csv text). This is the expensive part of the conversion which runs in the worker processes. 
+    Return the first and the last tz-aware timestamp of the data and the encoded data."""
+
+    new_data = read_file(*args)
+    if new_data.empty:
+        return None, None, None
+
+    return new_data.index[0], new_data.index[-1], encode(new_data)
+
+
+def decode_transnet_times(times):
+
+    """ Decode unique time strings of TransnetBW data with the fixed layout 'HH:MM:SS', or 'HHA:MM:SS'/'HHB:MM:SS'
+    for the hour that occurs twice at the end of DST, directly from their bytes. Return the nanoseconds since 
+    midnight, the DST flag (True for 'A'), the mask of A/B-marked times and the mask of valid time strings."""
+
+    raw = np.asarray(times, dtype='S10').view(np.uint8).reshape(-1, 10).astype(np.int64)
+    
+    # Remove the A/B suffix of the ambiguous hour, so that all times have the layout 'HH:MM:SS'
+    marked = (raw[:, 2] == ord('A')) | (raw[:, 2] == ord('B'))
+    dst = raw[:, 2] == ord('A')
+    hms = np.where(marked[:, None], raw[:, [0, 1, 3, 4, 5, 6, 7, 8]], raw[:, :8])
+
+    digits = hms[:, [0, 1, 3, 4, 6, 7]] - ord('0')
+    hours = 10 * digits[:, 0] + digits[:, 1]
+    minutes = 10 * digits[:, 2] + digits[:, 3]
+    seconds = 10 * digits[:, 4] + digits[:, 5]
+
+    valid = (((digits >= 0) & (digits <= 9)).all(axis=1) & (hms[:, 2] == ord(':')) & (hms[:, 5] == ord(':'))
+             & (hours < 24) & (minutes < 60) & (seconds < 60)
+             & (raw[:, 9] == 0) & (marked | (raw[:, 8] == 0)))
+
+    ns = ((hours * 60 + minutes) * 60 + seconds) * 10**9
+
+    return ns, dst, marked, valid
+
+
+def parse_transnet_timestamps(day, time_of_day, tz='CET'):
+
+    """ Convert the day ('%Y/%m/%d') and time columns of TransnetBW data to a tz-aware DatetimeIndex in a single 
+    vectorized pass. Both columns only have few distinct values per month (31 days, 86400+3600 times), so that 
+    only these are decoded. Timestamps with unknown formats are parsed with pd.to_datetime or set to NaT."""
+
+    day_codes, days = pd.factorize(day)
+    time_codes, times = pd.factorize(time_of_day)
+
+    nat = np.iinfo(np.int64).min
+    day_ns = pd.to_datetime(days, format='%Y/%m/%d', errors='coerce').values.astype('datetime64[ns]').view(np.int64)
+    day_valid = day_ns != nat
+    time_ns, time_dst, time_marked, time_valid = decode_transnet_times(times)
+
+    # Combine the decoded values in int64 nanoseconds of naive local time (NaN-entries have code -1)
+    valid = (day_codes >= 0) & (time_codes >= 0)
+    valid[valid] = day_valid[day_codes[valid]] & time_valid[time_codes[valid]]
+    ns = np.full(len(day_codes), nat, dtype=np.int64)
+    ns[valid] = day_ns[day_codes[valid]] + time_ns[time_codes[valid]]
+    ind = pd.DatetimeIndex(ns.view('datetime64[ns]'))
+
+    # Fall back to the general parser for timestamps with other formats
+    if not valid.all():
+        fallback = np.flatnonzero(~valid)
+        dt_data = pd.Series(day).iloc[fallback].astype(str) + ' ' + pd.Series(time_of_day).iloc[fallback].astype(str)
+        parsed = pd.to_datetime(dt_data, errors='coerce')
+        if parsed.hasnans:
+            print('There are unknown datetime formats in the data!')
+        ns[fallback] = parsed.values.astype('datetime64[ns]').view(np.int64)
+        ind = pd.DatetimeIndex(ns.view('datetime64[ns]'))
+
+    # Localize the index to obtain unique timestamps also during DST changes. Use the A/B flags of the
+    # ambiguous hour where they are present and infer the DST from the order of the other timestamps (e.g. of
+    # unmarked ambiguous hours in the same file). Unmarked ambiguous times that cannot be inferred raise an error.
+    marked = (time_codes >= 0) & time_marked[time_codes]
+    if not marked.any():
+        return ind.tz_localize(tz, ambiguous='infer')
+
+    ns = np.empty(len(ind), dtype=np.int64)
+    ns[marked] = as_ns(ind[marked].tz_localize(tz, ambiguous=time_dst[time_codes[marked]]))
+    ns[~marked] = as_ns(ind[~marked].tz_localize(tz, ambiguous='infer'))
+
+    return pd.DatetimeIndex(ns.view('datetime64[ns]')).tz_localize('UTC').tz_convert(tz)
+
+
+def read_transnet_month(file, start_time, end_time):
     
-def correct_indices_transnet(in_path, out_path, tso_name):
+    """ Read one month of TransnetBW data and align it to the full month index (in CET)."""
+
+    # Read external data
+    new_data = pd.read_csv(file, header=None, names=['day', 'time', 'f'], usecols=[0, 1, 3],
+                           dtype={'day': str, 'time': str})
+
+    # Convert the datetime columns to a localized index to obtain unique timestamps also during DST changes
+    ind = parse_transnet_timestamps(new_data.day.values, new_data.time.values, tz='CET')
+    new_data = pd.Series(new_data.f.values, index=ind)
+
+    # Remove duplicated recordings
+    new_data = new_data[~new_data.index.duplicated()]
+
+    # Align data to the full month index and fill missing data with NaN
+    full_ind = pd.date_range(start=start_time, end=end_time, freq='1s', tz='CET')
+    new_data = new_data.reindex(full_ind, fill_value=np.nan)
+
+    # Make sure that all values have the same format 'float64'
+    return new_data.astype('float64')
+
+
+def read_nationalgrid_month(file, start_time, end_time):
     
-    """ Convert TransnetBW data to pandas Series with complete, tz-localized time index."""
+    """ Read one month of Nationalgrid data and assign the full month index (in GB local time)."""
+
+    # Read external data
+    new_data = pd.read_csv(file)
+
+    # Align data to the full month index. 
+    # The data indices have different formats, so that we need to create our own one.
+    full_ind = pd.date_range(start=start_time, end=end_time, freq='1s', tz='UTC')
+    new_data.index = full_ind.tz_convert('GB')
+
+    return new_data.f.astype('float64')
+
+
+def read_fingrid_file(file):
+    
+    """ Read one file of Fingrid data, localize it in its timezone and resample it to a resolution of 1s."""
+
+    # Read external data
+    new_data = pd.read_csv(file, index_col='Time', parse_dates=True)
+
+    # Localize the datetime index in its timezone 
+    new_data.index = new_data.index.tz_localize('Europe/Helsinki', ambiguous='infer')
+
+    # Resampling
+    new_data = new_data.resample('1s').mean()
+
+    return new_data.loc[:, 'Value'].astype('float64')
+
+
+def progress_time(progress, tz):
+
+    """ Last converted timestamp of progress in tz. The stored string only has a fixed UTC offset, so that the
+    timezone (with its DST changes) is restored by the conversion."""
+
+    return pd.Timestamp(progress['last_time']).tz_convert(tz)
+
+
+def new_months(files, start_time, end_time, progress, tz):
+
+    """ Select the months of prepare_files that start after the last converted timestamp in progress (all months
+    if progress is None or empty). The naive start times are interpreted in tz."""
+
+    if not progress:
+        return files, start_time, end_time
+
+    new = start_time.tz_localize(tz) > progress_time(progress, tz)
+
+    return files[new], start_time[new], end_time[new]
+
+
+def correct_indices_transnet(in_path, out_path, tso_name, workers=1, storage='zip', dtype='float64', progress=None):
+    
+    """ Convert TransnetBW data to pandas Series with complete, tz-localized time index. The months are
+    processed in a pool of workers processes and streamed in order into the yearly output files. The output 
+    format is set by storage (see open_writer). 
+    
+    For incremental updates, progress is a dict with the last converted timestamp 'last_time' (empty for the 
+    first update). Only newer months are converted and appended to the outputs, and progress is updated."""
     
     # Prepare files and initial/final timestamps of the months
     files_name_pattern = '{}/{year:.4}{month:.2}_Frequenz.csv'
-    files, start_time, end_time = prepare_files(in_path, files_name_pattern)
+    files, start_time, end_time = new_months(*prepare_files(in_path, files_name_pattern), progress, 'CET')
 
-    data = pd.Series()
     print('Processing the TransnetBW data...\n')
     
-    for i, file in enumerate(files):
-        print('File {} of {}'.format(i, len(files)))
-        print(file)
-        
-        # Read external data
-        new_data = pd.read_csv(file, header=None, names=['day', 'time', 'f'], usecols=[0, 1, 3])
+    # Save reindexed data (with naive local time in csv files)
+    with open_writer(out_path, '_converted', tso_name, storage, float_format='%.6f', dtype=dtype,
+                     append=bool(progress)) as writer:
 
-        # Concatenate datetime columns from imported data
-        dt_data = new_data.day + ' ' + new_data.time
+        # The months are independent, since the DST changes never fall on a month boundary
+        args = [(read_transnet_month, writer.encoder, file, start, end)
+                for file, start, end in zip(files, start_time, end_time)]
 
-        # Convert dt_data to datetime and coerce parsing-errors into setting values to NaN
-        ind = pd.to_datetime(dt_data, errors='coerce')
+        for i, (file, month) in enumerate(zip(files, map_files(convert_file, args, workers))):
+            print('File {} of {}'.format(i, len(files)))
+            print(file)
 
-        # If there are errors, try two other datetime formats that can occur in the data due to DST
-        if ind.hasnans:
-            try:
-                mask = ind.isnull()
-                ind_a = pd.to_datetime(dt_data[mask], format='%Y/%m/%d %HA:%M:%S', errors='coerce').dropna()
-                ind_b = pd.to_datetime(dt_data[mask], format='%Y/%m/%d %HB:%M:%S', errors='coerce').dropna()
-                ind[mask] = ind_a.append(ind_b).values
-            except ValueError:
-                print('There are unknown datetime formats in the data! Add them to dt_formats!')
-
-        # Localize datetime index to obtain unique timestamps also during DST changes
-        ind = ind.dt.tz_localize('CET', ambiguous='infer')
-        new_data = new_data.set_index(ind).loc[:, 'f']
-
-        # Remove duplicated recordings
-        new_data = new_data[~new_data.index.duplicated()]
-
-        # Align data to the full month index and fill missing data with NaN
-        full_ind = pd.date_range(start=start_time[i], end=end_time[i], freq='1s', tz='CET')
-        new_data = new_data.reindex(full_ind, fill_value=np.NaN)
-
-        # Append to other data and make sure that all values have the same format 'float64'
-        data = data.append(new_data.astype('float64'))
-        
-    # Convert timestamp to naive local time (removing tz-information)
-    data.index = data.index.tz_localize(None)
-    
-    # Save reindexed data
-    print('Saving processed data...')
-    suffix = '_converted'
-    create_year_folders(out_path, data, suffix, tso_name)
-    data.groupby(by=data.index.year).apply(lambda x: x.to_csv(out_path + '{}'.format(x.name) + suffix + \
-                                                              '/' + tso_name + '/{}.zip'.format(x.name),
-                                                              float_format='%.6f',
-                                                              na_rep='NaN',
-                                                              compression={'method':'zip',
-                                                                           'archive_name':'{}.csv'.format(x.name)},
-                                                              header=False))
-
-def correct_indices_nationalgrid(in_path, out_path, tso_name):
+            _, last_time, encoded = month.result()
+            writer.write_encoded(encoded)
+            if progress is not None:
+                progress['last_time'] = str(last_time)
+
+
+def correct_indices_nationalgrid(in_path, out_path, tso_name, workers=1, storage='zip', dtype='float64',
+                                 progress=None):
     
-    """ Convert Nationalgrid data to pandas Series with complete, tz-localied time index."""
+    """ Convert Nationalgrid data to pandas Series with complete, tz-localied time index. The months are
+    processed in a pool of workers processes and streamed in order into the yearly output files. The output 
+    format is set by storage (see open_writer). For incremental updates, only months after progress['last_time'] 
+    are converted (see correct_indices_transnet)."""
     
-    # Prepare files and initial/final timestamps of the months
+    # Prepare files and initial/final timestamps of the months (in UTC)
     files_name_pattern = '{}/f {year:.4} {month}.csv'
-    files, start_time, end_time = prepare_files(in_path, files_name_pattern)
+    files, start_time, end_time = new_months(*prepare_files(in_path, files_name_pattern), progress, 'UTC')
 
-    data = pd.Series()
     print('Processing the Nationalgrid data...\n')
     
-    for i, file in enumerate(files):
-        print('File {} of {}'.format(i, len(files)))
-        print(file)
-
-        # Read external data
-        new_data = pd.read_csv(file)
-
-        # Align data to the full month index. 
-        # The data indices have different formats, so that we need to create our own one.
-        full_ind = pd.date_range(start=start_time[i], end=end_time[i], freq='1s',
-                                 tz='UTC')
-        new_data.index = full_ind.tz_convert('GB')
-
-        # Append to other data
-        data = data.append(new_data.f)
-
-    # Convert timestamp to naive local time (removing tz-information)
-    data.index = data.index.tz_localize(None)
-
-    # Save reindexed data
-    print('Saving processed data...')
-    suffix = '_converted'
-    create_year_folders(out_path, data, suffix, tso_name)
-    data.groupby(by=data.index.year).apply(lambda x: x.to_csv(out_path + '{}'.format(x.name) + suffix + \
-                                                              '/' + tso_name + '/{}.zip'.format(x.name),
-                                                              float_format='%.3f',
-                                                              na_rep='NaN',
-                                                              compression={'method':'zip',
-                                                                           'archive_name':'{}.csv'.format(x.name)},
-                                                              header=False))
-
-def correct_indices_fingrid(in_path, out_path, tso_name):
+    # Save reindexed data (with naive local time in csv files)
+    with open_writer(out_path, '_converted', tso_name, storage, float_format='%.3f', dtype=dtype,
+                     append=bool(progress)) as writer:
+
+        args = [(read_nationalgrid_month, writer.encoder, file, start, end) 
+                for file, start, end in zip(files, start_time, end_time)]
+
+        for i, (file, month) in enumerate(zip(files, map_files(convert_file, args, workers))):
+            print('File {} of {}'.format(i, len(files)))
+            print(file)
+
+            _, last_time, encoded = month.result()
+            writer.write_encoded(encoded)
+            if progress is not None:
+                progress['last_time'] = str(last_time)
+
+
+def correct_indices_fingrid(in_path, out_path, tso_name, workers=1, storage='zip', dtype='float64', 
+                            gap_chunk='31D', progress=None):
     
     """ Convert Fingrid data to pandas Series with complete, tz-localied time index and resample
-    it to a resolution of 1s."""
+    it to a resolution of 1s. The files are processed in a pool of workers processes and streamed in order 
+    into the yearly output files. The output format is set by storage (see open_writer). Gaps between files 
+    are filled with NaN in chunks of length gap_chunk. 
+    
+    For incremental updates, progress is a dict with the last converted timestamp 'last_time' and file 
+    'last_file' (empty for the first update). Only later files are converted and appended to the outputs, and 
+    progress is updated."""
     
     # Prepare files. 
     # Due to the file name format, the np.sort already produces the correct file order in time!
     files = glob.glob(in_path + '*.csv')
     files = np.sort(files)
 
-    data = pd.Series()
+    last_time = None
+    if progress:
+        files = files[[os.path.basename(file) > progress['last_file'] for file in files]]
+        last_time = progress_time(progress, TIMEZONES['Fingrid'])
+
     print('Processing the Fingrid data...\n')
     
-    for i, file in enumerate(files):
+    with open_writer(out_path, '_converted', tso_name, storage, float_format='%.4f', dtype=dtype,
+                     append=bool(progress)) as writer:
 
-        print('File {} of {}'.format(i, len(files)))
-        print(file)
+        args = [(read_fingrid_file, writer.encoder, file) for file in files]
 
-        try:
-            # Read external data
-            new_data = pd.read_csv(file, index_col='Time', parse_dates=True)
+        for i, (file, part) in enumerate(zip(files, map_files(convert_file, args, workers))):
 
-            # Localize the datetime index in its timezone 
-            new_data.index = new_data.index.tz_localize('Europe/Helsinki',
-                                                        ambiguous='infer')
+            print('File {} of {}'.format(i, len(files)))
+            print(file)
 
-            # Resampling
-            new_data = new_data.resample('1S').mean()
+            try:
+                first_time, new_last_time, encoded = part.result()
+            except Exception as e:
+                # There are some empty data files which have to be filtered out by this exception
+                print(e)
+                continue
+            if first_time is None:
+                continue
 
-            # Append to other data
-            data = data.append(new_data.loc[:,'Value'])
+            if last_time is not None:
+                if first_time <= last_time:
+                    raise ValueError('The recordings in {} overlap with the previous file!'.format(file))
 
-        except Exception as e:
-            # There are some empty data files which have to be filtered out by this exception
-            print(e)
-            continue
+                # Identify missing values between the files with NaNs (complete index from first to last recording)
+                gap_start = last_time + pd.Timedelta(seconds=1)
+                gap_end = first_time - pd.Timedelta(seconds=1)
+                while gap_start <= gap_end:
+                    gap_ind = pd.date_range(start=gap_start, end=min(gap_start + pd.Timedelta(gap_chunk)
+                                                                     - pd.Timedelta(seconds=1), gap_end),
+                                            freq='1s')
+                    writer.write(pd.Series(np.nan, index=gap_ind, dtype='float64'))
+                    gap_start = gap_ind[-1] + pd.Timedelta(seconds=1)
+
+            # Save reindexed data (with naive local time in csv files)
+            writer.write_encoded(encoded)
+            last_time = new_last_time
+            if progress is not None:
+                progress.update(last_time=str(last_time), last_file=os.path.basename(file))
+
+
+def load_update_state(state_file):
+
+    """ Load the state of the incremental updates of a TSO (empty dict if there was no update before)."""
+
+    if not os.path.exists(state_file):
+        return {}
+
+    with open(state_file) as f:
+        state = json.load(f)
+
+    # The raw samples that are carried over in the cleansing are stored with naive local time in ns
+    cleansing = state.get('cleansing')
+    if cleansing is not None:
+        held = cleansing.pop('held_values'), cleansing.pop('held_index')
+        cleansing['held'] = pd.Series(held[0], index=pd.DatetimeIndex(np.array(held[1], dtype='datetime64[ns]')),
+                                      dtype='float64')
 
-    # Reindex with full index and identify missing values with NaNs.
-    full_ind = pd.date_range(start=data.index[0], end=data.index[-1], freq='1S',
-                             tz='Europe/Helsinki')
-    data = data.reindex(full_ind, fill_value=np.NaN)
+    return state
 
-    # Convert timestamp to naive local time (removing tz-information)
-    data.index = data.index.tz_localize(None)
+
+def save_update_state(state_file, state):
+
+    """ Save the state of the incremental updates of a TSO. The file is replaced only after it is complete."""
+
+    state = dict(state)
+    if 'cleansing' in state:
+        cleansing = dict(state['cleansing'])
+        held = cleansing.pop('held')
+        held = pd.Series(dtype='float64') if held is None else held
+        cleansing.update(held_values=held.values.tolist(), held_index=as_ns(held.index).tolist(),
+                         prev_value=float(cleansing['prev_value']), last_valid=float(cleansing['last_valid']),
+                         run_len=int(cleansing['run_len']), gap=int(cleansing['gap']))
+        state['cleansing'] = cleansing
+
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(state_file + '.tmp', state_file)
+
+
+def update_tso_data(convert, in_path, root_folder, tso_name, float_format, workers=1, storage='zip', 
+                    dtype='float64', N_f=6, T_c=60, df_c=0.05, limit=(49, 51), chunk_size=2**22, state_file=None):
+
+    """ Convert and cleanse only the new recordings of a TSO and append them to the yearly outputs. convert is
+    the correct_indices function of the TSO and float_format the precision of the cleansed csv files. The per-TSO
+    state file (default: {root_folder}{tso_name}_update_state.json) keeps the last converted timestamp, the 
+    position of the cleansing in the converted data and the state of clean_chunks (carried raw samples, length 
+    of a trailing constant window, last valid value, ...). 
+    
+    Without state file, the complete data is converted and cleansed. In both cases, the outputs are identical to
+    the ones of convert_data_format.py and clean_corrupted_data.py (applied to the complete data).""" 
+
+    state_file = root_folder + '{}_update_state.json'.format(tso_name) if state_file is None else state_file
+    state = load_update_state(state_file)
+
+    parameters = {'N_f': N_f, 'T_c': T_c, 'df_c': df_c, 'limit': list(limit), 'storage': storage}
+    if state and state['parameters'] != parameters:
+        raise ValueError('The parameters differ from the previous updates ({}). Remove {} to rebuild the outputs!'
+                         .format(state['parameters'], state_file))
     
-    # Save reindexed data 
-    print('Saving processed data...')
-    suffix = '_converted'
-    create_year_folders(out_path, data, suffix, tso_name)
-    data.groupby(by=data.index.year).apply(lambda x: x.to_csv(out_path + '{}'.format(x.name) + suffix + \
-                                                              '/' + tso_name + '/{}.zip'.format(x.name),
-                                                              float_format='%.4f',
-                                                              na_rep='NaN',
-                                                              compression={'method':'zip',
-                                                                           'archive_name':'{}.csv'.format(x.name)},
-                                                              header=False))
+    ### Convert the new files ###
+
+    progress = state.get('converted', {})
+    # Last converted timestamp that has been cleansed (states of older versions are saved after both steps)
+    cleansed_time = state.get('cleansing', {}).get('last_time', progress.get('last_time'))
+    convert(in_path, root_folder, tso_name, workers=workers, storage=storage, dtype=dtype, progress=progress)
+
+    if not progress or progress.get('last_time') == cleansed_time:
+        print('There is no new data of {}.'.format(tso_name))
+        return
+
+    # The appended conversion is saved at once, so that an interrupted cleansing does not convert (and append) 
+    # the same months again. The next update then only continues the cleansing.
+    state.update(parameters=parameters, converted=progress)
+    save_update_state(state_file, state)
+
+    ### Cleanse the new converted data ###
+
+    cleansing = state.get('cleansing', {'year': None, 'rows': 0})
+
+    # Replace the values that were cleansed provisionally at the end of the last update (the truncation is saved,
+    # so that the rerun of an interrupted cleansing does not remove them twice)
+    held = cleansing.get('held')
+    if held is not None and not held.empty and not cleansing.get('truncated'):
+        truncate_outputs(root_folder, '_cleansed', tso_name, len(held), storage)
+        cleansing['truncated'] = True
+        save_update_state(state_file, state)
+
+    position = {'year': cleansing.pop('year'), 'rows': cleansing.pop('rows')}
+    cleansing.pop('last_time', None)
+    cleansing.pop('truncated', None)
+
+    years = available_years(root_folder, '_converted', tso_name)
+    if position['year'] is not None:
+        years = [year for year in years if year >= position['year']]
+    chunks = iter_chunks(root_folder, '_converted', tso_name, years, storage.split(',')[0], chunk_size,
+                         skip=position['rows'])
+
+    def track(chunks):
+        # Count the converted values of the current year that have been cleansed
+        for chunk in chunks:
+            year = chunk.index[0].year
+            if year != position['year']:
+                position.update(year=int(year), rows=0)
+            position['rows'] += len(chunk)
+            yield chunk
+
+    print('Mark and clean corrupted data in chunks ...')
+    with open_writer(root_folder, '_cleansed', tso_name, storage, float_format=float_format, dtype=dtype,
+                     append='cleansing' in state) as writer:
+        for chunk in clean_chunks(track(chunks), N_f, T_c, df_c, limit, state=cleansing):
+            writer.write(chunk)
 
+    cleansing.update(position, last_time=progress['last_time'])
+    state.update(parameters=parameters, converted=progress, cleansing=cleansing)
+    save_update_state(state_file, state)
@@ -0,0 +1,94 @@
+"""
+Lazy, batched inference of the trained models with a disk cache of the raw outputs
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Models loaded in this process (shared by all runners)
+_models = {}
+
+
+def model_fingerprint(path):
+    """ Absolute path and latest modification time of a saved model (file or SavedModel folder)."""
+
+    mtimes = [os.stat(path).st_mtime_ns]
+    for folder, _, files in os.walk(path):
+        mtimes += [os.stat(os.path.join(folder, name)).st_mtime_ns for name in files]
+
+    return [os.path.abspath(path), max(mtimes)]
+
+
+def array_hash(values):
+    """ Hash of the shape, dtype and content of an array."""
+
+    values = np.ascontiguousarray(values)
+    digest = hashlib.sha256(json.dumps([values.shape, values.dtype.str]).encode())
+    digest.update(values.data)
+
+    return digest.hexdigest()
+
+
+class InferenceRunner:
+    """
+    Runs one batched predict per model and input array and caches the raw outputs on disk. Entries are keyed by
+    the model (path and modification time) and a hash of the inputs, so that re-running an evaluation (e.g. after
+    changes of the plots) serves the outputs from the cache without loading the models. The models are only
+    loaded on a cache miss and at most once per process.
+
+    Args:
+        folder (str, optional): Folder of the cached outputs.
+        batch_size (int, optional): Batch size of the predictions.
+    """
+
+    def __init__(self, folder='trained_models/predictions', batch_size=1024):
+        self.folder = folder
+        self.batch_size = batch_size
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def model(path, custom_objects=None):
+        """ Load the model at path (once per process)."""
+
+        path = os.path.abspath(path)
+        if path not in _models:
+            from keras.models import load_model
+            _models[path] = load_model(path, custom_objects=custom_objects)
+
+        return _models[path]
+
+    @staticmethod
+    def key(path, inputs):
+        content = json.dumps({'model': model_fingerprint(path), 'inputs': array_hash(inputs)})
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def predict(self, path, inputs, custom_objects=None, rows=None):
+        """
+        Raw outputs of the model at path for all inputs, memory-mapped from the cache.
+
+        Args:
+            path (str): Path of the saved model.
+            inputs (numpy.ndarray): Inputs of the model (n_samples, n_features).
+            custom_objects (dict, optional): Custom objects to load the model (e.g. the loss).
+            rows (optional): Rows of the outputs to return (e.g. the samples of a plot), all rows by default.
+
+        Returns:
+            numpy.ndarray: outputs of the model (n_samples, n_outputs) or of the given rows
+        """
+
+        file = os.path.join(self.folder, self.key(path, inputs) + '.npy')
+        if not os.path.exists(file):
+            outputs = self.model(path, custom_objects).predict(inputs, batch_size=self.batch_size)
+            # The entry is only visible after it is complete
+            tmp_file = file[:-len('.npy')] + '.tmp.npy'
+            np.save(tmp_file, np.asarray(outputs))
+            os.replace(tmp_file, file)
+
+        outputs = np.load(file, mmap_mode='r')
+        if rows is None:
+            return outputs
+
+        return np.asarray(outputs[rows])
@@ -0,0 +1,149 @@
+"""
+Streaming normalization statistics (mean and variance per column) that are merged across chunks and workers
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class StreamingNormalizer:
+    """
+    Mean and variance of the columns of a data stream. Each chunk is reduced to (count, mean, M2) and merged
+    with the statistics of the previous chunks with the parallel algorithm of Chan et al., i.e., Welford's
+    update for whole chunks. Hence, the statistics do not require the full data in memory and the normalizers
+    of several workers can be merged. Missing values (NaN) are skipped as in pandas.
+
+    The transform standardizes the columns as sklearn's StandardScaler (population std, zero std replaced by
+    one), so that the normalizer can replace the pickled scalers.
+
+    Args:
+        n_features (int, optional): Number of columns (inferred from the first chunk by default).
+        columns (list, optional): Names of the columns (taken from the first data frame by default).
+    """
+
+    def __init__(self, n_features=None, columns=None):
+        self.columns = None if columns is None else list(columns)
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        if n_features is not None:
+            self._reset(n_features)
+
+    def _reset(self, n_features):
+        self.count = np.zeros(n_features, dtype=np.int64)
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, chunk):
+        """ Add the rows of chunk (2-d array, pandas DataFrame or 1-d array of one column)."""
+
+        if isinstance(chunk, pd.DataFrame) and self.columns is None:
+            self.columns = list(chunk.columns)
+        values = np.asarray(chunk, dtype='float64')
+        values = values.reshape(len(values), -1)
+
+        valid = ~np.isnan(values)
+        count = valid.sum(0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, values, 0.).sum(0)/count
+            m2 = np.where(valid, values - mean, 0.)**2
+        other = StreamingNormalizer()
+        other.count, other.mean, other.m2 = count, np.nan_to_num(mean), m2.sum(0)
+
+        return self.merge(other)
+
+    def merge(self, other):
+        """ Merge the statistics of another normalizer (e.g. of another worker) into this one."""
+
+        if self.count is None:
+            self._reset(len(other.count))
+        if self.columns is None:
+            self.columns = other.columns
+        if len(other.count) != len(self.count):
+            raise ValueError('The normalizers have a different number of columns!')
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(count > 0, other.count/count, 0.)
+        self.mean = self.mean + delta*weight
+        self.m2 = self.m2 + other.m2 + delta**2*self.count*weight
+        self.count = count
+
+        return self
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """ Normalizer of an iterable of chunks."""
+
+        normalizer = cls()
+        for chunk in chunks:
+            normalizer.update(chunk)
+
+        return normalizer
+
+    def var(self, ddof=1):
+        """ Variance of the columns (sample variance as pandas for ddof=1)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2/(self.count - ddof), np.nan)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.var(ddof))
+
+    @property
+    def scale(self):
+        """ Population std of the columns with zeros replaced by one (scale_ of StandardScaler)."""
+        std = self.std(0)
+        return np.where(std > 0, std, 1.)
+
+    def transform(self, values, dtype=None):
+        """ Standardize values (2-d array or data frame with the columns of the normalizer)."""
+
+        if dtype is None:
+            dtype = np.asarray(values).dtype
+            dtype = dtype if np.issubdtype(dtype, np.floating) else np.dtype('float64')
+        result = ((np.asarray(values, dtype='float64') - self.mean)/self.scale).astype(dtype, copy=False)
+        if isinstance(values, pd.DataFrame):
+            return pd.DataFrame(result, index=values.index, columns=values.columns)
+
+        return result
+
+    def inverse_transform(self, values):
+        return np.asarray(values)*self.scale + self.mean
+
+    def save(self, file):
+        """ Save the statistics as binary .npz file."""
+
+        columns = np.array([] if self.columns is None else self.columns, dtype=str)
+        np.savez(file, count=self.count, mean=self.mean, m2=self.m2, columns=columns)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            normalizer = cls(columns=[str(column) for column in data['columns']] or None)
+            normalizer.count, normalizer.mean, normalizer.m2 = data['count'], data['mean'], data['m2']
+
+        return normalizer
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        """ Normalizer with the statistics of a fitted sklearn StandardScaler."""
+
+        n_features = len(scaler.mean_)
+        normalizer = cls(columns=getattr(scaler, 'feature_names_in_', None))
+        normalizer.count = np.broadcast_to(scaler.n_samples_seen_, (n_features,)).astype(np.int64)
+        normalizer.mean = np.asarray(scaler.mean_, dtype='float64')
+        normalizer.m2 = np.asarray(scaler.var_, dtype='float64')*normalizer.count
+
+        return normalizer
+
+
+def load_normalizer(file):
+    """ Load a normalizer saved with StreamingNormalizer.save (.npz) or convert a StandardScaler that was
+    pickled with joblib (e.g. scaler.gz)."""
+
+    if file.endswith('.npz'):
+        return StreamingNormalizer.load(file)
+
+    import joblib
+    return StreamingNormalizer.from_sklearn(joblib.load(file))
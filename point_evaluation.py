@@ -0,0 +1,132 @@
+"""
+One-pass evaluation of point forecasts (MAE, MSE, RMSE) with per-horizon curves, hour-of-day breakdowns and
+bootstrap confidence intervals
+"""
+
+import numpy as np
+import pandas as pd
+
+METRICS = ('MAE', 'MSE', 'RMSE')
+
+
+def error_sums(prediction, target, horizon=None, chunk_size=1024, weights=None):
+    """
+    Absolute and squared errors of the first horizon steps in one pass over chunks of rows (without copies of
+    the column slices).
+
+    Args:
+        weights (numpy.ndarray, optional): Row weights (n_weights, n_rows), e.g. bootstrap counts or hour-of-day
+        indicators, for weighted sums of the squared errors per step.
+
+    Returns:
+        tuple: per-row means of the absolute errors (n_rows,), per-step means of the absolute and squared errors
+        (horizon,) and weighted sums of the squared errors per step (n_weights, horizon) or None
+    """
+
+    horizon = prediction.shape[1] if horizon is None else horizon
+    if len(prediction) != len(target):
+        raise ValueError('Predictions and targets have a different number of rows!')
+
+    n_rows = len(prediction)
+    row_abs = np.empty(n_rows)
+    step_abs, step_squared = np.zeros(horizon), np.zeros(horizon)
+    weighted = None if weights is None else np.zeros((len(weights), horizon))
+    for i in range(0, n_rows, chunk_size):
+        rows = slice(i, i + chunk_size)
+        errors = np.asarray(prediction[rows, :horizon], dtype='float64') - target[rows, :horizon]
+        absolute = np.abs(errors)
+        squared = np.square(errors, out=errors)
+        row_abs[rows] = absolute.mean(1)
+        step_abs += absolute.sum(0)
+        step_squared += squared.sum(0)
+        if weights is not None:
+            weighted += weights[:, rows] @ squared
+
+    return row_abs, step_abs/n_rows, step_squared/n_rows, weighted
+
+
+def metric_values(metric, absolute, squared):
+    """ Metric of the mean absolute errors and the mean squared errors per horizon step (last axis of squared).
+    As with sklearn for (rows, horizon) arrays, the RMSE is the mean of the RMSEs of the steps."""
+
+    if metric == 'MAE':
+        return absolute
+    if metric == 'MSE':
+        return squared.mean(-1)
+    if metric == 'RMSE':
+        return np.sqrt(squared).mean(-1)
+    raise ValueError('Unknown Measure')
+
+
+def evaluate_point_predictions(predictions, targets, horizon=None, hours=None, metrics=METRICS, n_bootstrap=1000,
+                               confidence=0.95, seed=0, chunk_size=1024):
+    """
+    Evaluate point predictions with all metrics in one pass per model. The RMSE is the mean of the RMSEs of the
+    horizon steps (as before with sklearn), also for the hours of day and the bootstrap resamples.
+
+    Args:
+        predictions (dict): Arrays of the predictions (n_rows, n_steps) of each model.
+        targets (numpy.ndarray or dict): Observations (n_rows, n_steps) of all models or of each model.
+        horizon (int, optional): Number of evaluated steps (default: all steps).
+        hours (numpy.ndarray, optional): Hour of day of each row for the hour-of-day breakdown.
+        metrics (list, optional): 'MAE', 'MSE' and/or 'RMSE'.
+        n_bootstrap (int, optional): Number of bootstrap resamples of the rows for the confidence intervals
+        (0 to skip them).
+        confidence (float, optional): Level of the confidence intervals.
+        seed (int, optional): Seed of the bootstrap resamples.
+        chunk_size (int, optional): Number of rows per chunk.
+
+    Returns:
+        pandas.DataFrame: tidy results with columns model, metric, scope ('overall', 'horizon_step' or
+        'hour_of_day'), key (step or hour), value, ci_lower and ci_upper
+    """
+
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence)/2
+    results = []
+    if hours is not None:
+        hours = np.asarray(hours)
+        hour_counts = np.bincount(hours, minlength=24)
+
+    for model, prediction in predictions.items():
+        target = targets[model] if isinstance(targets, dict) else targets
+        n_rows = len(prediction)
+
+        # The rows are resampled with multinomial counts, i.e., the bootstrap means are weighted sums of the rows.
+        # The squared errors per step of the resamples and hours of day are summed in the same pass.
+        weights = []
+        if n_bootstrap:
+            counts = rng.multinomial(n_rows, np.full(n_rows, 1/n_rows), size=n_bootstrap)
+            weights.append(counts)
+        if hours is not None:
+            if len(hours) != n_rows:
+                raise ValueError('hours must have one entry per row!')
+            weights.append(np.arange(24)[:, None] == hours)
+        weights = np.concatenate(weights).astype('float64') if weights else None
+
+        row_abs, step_abs, step_squared, weighted = error_sums(prediction, target, horizon, chunk_size, weights)
+
+        if n_bootstrap:
+            boot_abs, boot_squared = counts @ row_abs/n_rows, weighted[:n_bootstrap]/n_rows
+
+        if hours is not None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                hour_abs = np.bincount(hours, row_abs, minlength=24)/hour_counts
+                hour_squared = weighted[-24:]/hour_counts[:, None]
+
+        for metric in metrics:
+            value = metric_values(metric, row_abs.mean(), step_squared)
+            lower = upper = np.nan
+            if n_bootstrap:
+                lower, upper = np.quantile(metric_values(metric, boot_abs, boot_squared), [tail, 1 - tail])
+            results.append((model, metric, 'overall', None, value, lower, upper))
+
+            for step, value in enumerate(metric_values(metric, step_abs, step_squared[:, None])):
+                results.append((model, metric, 'horizon_step', step, value, np.nan, np.nan))
+
+            if hours is not None:
+                for hour, value in enumerate(metric_values(metric, hour_abs, hour_squared)):
+                    if hour_counts[hour]:
+                        results.append((model, metric, 'hour_of_day', hour, value, np.nan, np.nan))
+
+    return pd.DataFrame(results, columns=['model', 'metric', 'scope', 'key', 'value', 'ci_lower', 'ci_upper'])
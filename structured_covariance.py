@@ -0,0 +1,243 @@
+"""
+Structured covariance matrices of multivariate Gaussian forecasts and their scoring rules (negative log-likelihood
+and energy score) without dense (n_samples, n, n) tensors
+"""
+
+import numpy as np
+from scipy.linalg import solve_triangular
+
+
+class ScaledKernelCovariance:
+    """
+    Covariance matrices scale_i * K with a shared kernel matrix K (correlated Gaussian process models). The
+    Cholesky factor of K is computed once and shared by all samples.
+
+    Args:
+        scale (numpy.ndarray): Scales of the samples (n_samples,).
+        kernel (numpy.ndarray): Shared kernel matrix (n, n).
+        cholesky (numpy.ndarray, optional): Cholesky factor of kernel (computed by default).
+    """
+
+    def __init__(self, scale, kernel, cholesky=None):
+        self.scale = np.asarray(scale, dtype='float64').reshape(-1)
+        self.kernel = np.asarray(kernel, dtype='float64')
+        self.cholesky = np.linalg.cholesky(self.kernel) if cholesky is None else cholesky
+        self._kernel_logdet = 2*np.log(np.diag(self.cholesky)).sum()
+
+    def __len__(self):
+        return len(self.scale)
+
+    @property
+    def dim(self):
+        return len(self.kernel)
+
+    def take(self, rows):
+        """ Covariance matrices of the samples rows (index array or slice), sharing the Cholesky factor."""
+        return ScaledKernelCovariance(self.scale[rows], self.kernel, self.cholesky)
+
+    def diagonal(self):
+        return self.scale[:, None]*np.diag(self.kernel)
+
+    def logdet(self):
+        return self.dim*np.log(self.scale) + self._kernel_logdet
+
+    def mahalanobis(self, residuals):
+        """ Squared Mahalanobis norms r^T C^-1 r of the residuals (n_samples, n)."""
+        whitened = solve_triangular(self.cholesky, np.asarray(residuals, dtype='float64').T, lower=True)
+        return (whitened**2).sum(0)/self.scale
+
+    def noise(self, m, rng):
+        """ Samples of N(0, C) of shape (n_samples, m, n)."""
+        # One matrix product for all samples of all forecasts
+        noise = (rng.standard_normal((len(self)*m, self.dim)) @ self.cholesky.T).reshape(len(self), m, self.dim)
+        noise *= np.sqrt(self.scale)[:, None, None]
+        return noise
+
+
+class DiagonalCovariance:
+    """
+    Diagonal covariance matrices (independent Gaussian models) given by their variances.
+
+    Args:
+        variances (numpy.ndarray): Variances of the samples (n_samples, n).
+    """
+
+    def __init__(self, variances):
+        self.variances = np.asarray(variances, dtype='float64')
+
+    def __len__(self):
+        return len(self.variances)
+
+    @property
+    def dim(self):
+        return self.variances.shape[1]
+
+    def take(self, rows):
+        return DiagonalCovariance(self.variances[rows])
+
+    def diagonal(self):
+        return self.variances
+
+    def logdet(self):
+        return np.log(self.variances).sum(1)
+
+    def mahalanobis(self, residuals):
+        return (np.asarray(residuals, dtype='float64')**2/self.variances).sum(1)
+
+    def noise(self, m, rng):
+        return np.sqrt(self.variances)[:, None, :]*rng.standard_normal((len(self), m, self.dim))
+
+
+class LowRankDiagonalCovariance:
+    """
+    Covariance matrices D_i + W_i W_i^T of a low-rank factor W_i (n, r) and a diagonal D_i. The inverse and
+    determinant follow from the Woodbury identity and the matrix determinant lemma with the (r, r) capacitance
+    matrices I + W^T D^-1 W, so that the cost is O(n r^2) per sample.
+
+    Args:
+        factors (numpy.ndarray): Low-rank factors of the samples (n_samples, n, r) or a shared factor (n, r).
+        variances (numpy.ndarray): Diagonals of the samples (n_samples, n).
+    """
+
+    def __init__(self, factors, variances):
+        self.variances = np.asarray(variances, dtype='float64')
+        factors = np.asarray(factors, dtype='float64')
+        self.factors = np.broadcast_to(factors, (len(self.variances),) + factors.shape[-2:])
+
+    def __len__(self):
+        return len(self.variances)
+
+    @property
+    def dim(self):
+        return self.variances.shape[1]
+
+    def take(self, rows):
+        return LowRankDiagonalCovariance(self.factors[rows], self.variances[rows])
+
+    def diagonal(self):
+        return self.variances + (self.factors**2).sum(2)
+
+    def _capacitance(self):
+        scaled = self.factors/self.variances[:, :, None]
+        capacitance = np.eye(self.factors.shape[2]) + np.einsum('snr,snq->srq', self.factors, scaled)
+        return scaled, np.linalg.cholesky(capacitance)
+
+    def logdet(self):
+        _, cholesky = self._capacitance()
+        return np.log(self.variances).sum(1) + 2*np.log(np.diagonal(cholesky, axis1=1, axis2=2)).sum(1)
+
+    def mahalanobis(self, residuals):
+        residuals = np.asarray(residuals, dtype='float64')
+        scaled, cholesky = self._capacitance()
+        projected = np.einsum('snr,sn->sr', scaled, residuals)
+        whitened = solve_triangular(cholesky, projected[:, :, None], lower=True)[:, :, 0]
+        return (residuals**2/self.variances).sum(1) - (whitened**2).sum(1)
+
+    def noise(self, m, rng):
+        rank = self.factors.shape[2]
+        diagonal = np.sqrt(self.variances)[:, None, :]*rng.standard_normal((len(self), m, self.dim))
+        return diagonal + np.einsum('snr,smr->smn', self.factors, rng.standard_normal((len(self), m, rank)))
+
+
+def chunks(n_samples, chunk_size):
+    return (slice(i, min(i + chunk_size, n_samples)) for i in range(0, n_samples, chunk_size))
+
+
+def negative_log_likelihood(y, mu, covariance, chunk_size=4096):
+    """
+    Negative log-likelihood of the observations y under the multivariate Gaussian forecasts N(mu, C) for each
+    sample, computed in chunks of samples.
+
+    Args:
+        y (numpy.ndarray): Observations (n_samples, n).
+        mu (numpy.ndarray): Means (n_samples, n).
+        covariance: Structured covariance matrices (e.g. ScaledKernelCovariance).
+        chunk_size (int, optional): Number of samples per chunk.
+
+    Returns:
+        numpy.ndarray: negative log-likelihood of each sample
+    """
+
+    nll = np.empty(len(covariance))
+    for rows in chunks(len(covariance), chunk_size):
+        part = covariance.take(rows)
+        residuals = np.asarray(y[rows], dtype='float64') - np.asarray(mu[rows], dtype='float64')
+        nll[rows] = 0.5*(part.dim*np.log(2*np.pi) + part.logdet() + part.mahalanobis(residuals))
+
+    return nll
+
+
+def energy_scores(y, mu, covariance, m=100, seed=None, estimator='blocked', block_size=512, memory_budget=2**28):
+    """
+    Monte Carlo estimate of the energy score E||X - y|| - 0.5 E||X - X'|| of the Gaussian forecasts with m
+    samples per forecast. The samples of a chunk of forecasts are drawn with batched matrix products (one shared
+    Cholesky factor for ScaledKernelCovariance). E||X - X'|| is estimated by
+
+        'blocked': the mean over all pairs of different samples (O(m^2)), reduced over blocks of block_size
+        samples, so that the (m, m) distance matrices are never held at once.
+        'fair': the mean over the m pairs of consecutive samples (X_i, X_i+1 mod m), which is unbiased as well
+        and costs O(m), e.g. for m = 1000 - 3000.
+
+    The forecasts are processed in chunks that fit into memory_budget bytes.
+
+    Args:
+        y (numpy.ndarray): Observations (n_samples, n).
+        mu (numpy.ndarray): Means (n_samples, n).
+        covariance: Structured covariance matrices (e.g. ScaledKernelCovariance).
+        m (int, optional): Number of samples per forecast.
+        seed (int, optional): Seed of the samples.
+        estimator (str, optional): 'blocked' or 'fair'.
+        block_size (int, optional): Number of samples per block of the pairwise distances.
+        memory_budget (int, optional): Approximate memory of the samples and distance blocks per chunk in bytes.
+
+    Returns:
+        numpy.ndarray: energy score of each forecast
+    """
+
+    if estimator not in ('blocked', 'fair'):
+        raise ValueError('Unknown estimator {}!'.format(estimator))
+    if m < 2:
+        raise ValueError('The energy score requires at least two samples per forecast!')
+
+    rng = np.random.default_rng(seed)
+    block_size = min(block_size, m)
+    # Samples (and the standard normal draws) plus one block of distances per forecast
+    bytes_per_forecast = 8*(2*m*covariance.dim + block_size**2)
+    chunk_size = max(1, memory_budget//bytes_per_forecast)
+
+    scores = np.empty(len(covariance))
+    for rows in chunks(len(covariance), chunk_size):
+        samples = covariance.take(rows).noise(m, rng)
+        samples += np.asarray(mu[rows], dtype='float64')[:, None, :]
+        observed = np.linalg.norm(samples - np.asarray(y[rows], dtype='float64')[:, None, :], axis=2).mean(1)
+        if estimator == 'fair':
+            pairwise = np.linalg.norm(samples - np.roll(samples, -1, axis=1), axis=2).mean(1)
+        else:
+            pairwise = mean_pairwise_distances(samples, block_size)
+        scores[rows] = observed - 0.5*pairwise
+
+    return scores
+
+
+def mean_pairwise_distances(samples, block_size=512):
+    """ Mean Euclidean distance of all pairs of different samples (n_forecasts, m, n) of each forecast, reduced
+    over blocks of samples. The distances are computed from the Gram matrices of the blocks."""
+
+    m = samples.shape[1]
+    if m < 2:
+        raise ValueError('The pairwise distances require at least two samples per forecast!')
+    squared = (samples**2).sum(2)
+    total = np.zeros(len(samples))
+    for i in range(0, m, block_size):
+        for j in range(i, m, block_size):
+            a, b = slice(i, i + block_size), slice(j, j + block_size)
+            distances = squared[:, a, None] + squared[:, None, b] - 2*samples[:, a] @ samples[:, b].transpose(0, 2, 1)
+            distances = np.sqrt(np.maximum(distances, 0))
+            if i == j:
+                # Exact zeros on the diagonal (the Gram matrices leave rounding errors)
+                distances[:, np.arange(distances.shape[1]), np.arange(distances.shape[1])] = 0
+                total += distances.sum((1, 2))
+            else:
+                total += 2*distances.sum((1, 2))
+
+    return total/(m*(m - 1))
@@ -0,0 +1,61 @@
+# %%
+import argparse
+import sys
+sys.path.append('./')
+
+from scripts.helper_functions import (correct_indices_fingrid, correct_indices_nationalgrid, correct_indices_transnet,
+                                      update_tso_data)
+
+# Incremental update of the converted and cleansed data with new monthly deliveries of the TSOs. Only the new
+# files are converted and cleansed and appended to the yearly outputs. The results are identical to running
+# convert_data_format.py and clean_corrupted_data.py on the complete data. The first update builds the outputs
+# from scratch. The state of the updates is kept in {path_to_data}{tso_name}_update_state.json.
+
+# Add path where processed data should be saved
+path_to_data = './'
+# Add path to external (downloaded) data
+path_to_external_data = '../../External_data/'
+
+# Number of processes used to convert the monthly files (e.g. --workers 8) and storage format of the outputs
+# ('zip', 'npy', 'parquet' or e.g. 'zip,npy' for several formats, see open_writer)
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', type=int, default=1)
+parser.add_argument('--storage', default='zip')
+parser.add_argument('--dtype', default='float64')
+args = parser.parse_known_args()[0]
+workers, storage, dtype = args.workers, args.storage, args.dtype
+
+# Set parameters for identifying corrupted data (as in clean_corrupted_data.py)
+
+# Nan-points to fill
+N_f = 6
+# Maximum length of allowed constant windows
+T_c = 60
+# Minimum height of isolated peaks
+df_c = 0.05
+
+
+# %% TransnetBW
+
+# The __main__ guards are required for the process pool on platforms that spawn new processes
+if __name__ == '__main__':
+    in_path = path_to_external_data + 'Germany/transnetbw_frequency_data/'
+
+    update_tso_data(correct_indices_transnet, in_path, path_to_data, 'TransnetBW', '%.6f', workers, storage, dtype,
+                    N_f, T_c, df_c)
+
+# %% Fingrid
+
+if __name__ == '__main__':
+    in_path = path_to_external_data + 'Finland/fingrid_historic_frequency_data/'
+
+    update_tso_data(correct_indices_fingrid, in_path, path_to_data, 'Fingrid', '%.4f', workers, storage, dtype,
+                    N_f, T_c, df_c)
+
+#%% Nationalgrid
+
+if __name__ == '__main__':
+    in_path = path_to_external_data + 'GreatBritain/nationalgrideso_historic_frequency_data/'
+
+    update_tso_data(correct_indices_nationalgrid, in_path, path_to_data, 'Nationalgrid', '%.3f', workers, storage,
+                    dtype, N_f, T_c, df_c)